@@ -0,0 +1,293 @@
+"""
+@Author: Harrison Froedge, Shenghang Wang
+
+Benchmarks VariableElimination.run over a matrix of networks,
+    queries, evidence, heuristics and backends. Records wall time,
+    peak memory, the largest intermediate factor and the computation
+    count of every case, and writes them to JSON or CSV so that runs
+    of different versions can be compared.
+
+Usage:
+    python benchmark.py --output results.json
+    python benchmark.py --networks sachs insurance --backends dense --repeat 10
+    python benchmark.py --output new.json --compare old.json
+"""
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tracemalloc
+import statistics
+import numpy as np
+import pandas as pd
+import heuristics
+from read_bayesnet import BayesNet
+from variable_elim import VariableElimination
+from reports import CostTracker
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+NETWORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'network_files')
+
+# (network, query, evidence) per case
+CASES = [
+    ('earthquake', 'Alarm', {}),
+    ('earthquake', 'Burglary', {'JohnCalls': 'True', 'MaryCalls': 'True'}),
+    ('lungcancer', 'dysp', {}),
+    ('lungcancer', 'lung', {'smoke': 'yes', 'xray': 'yes'}),
+    ('sachs', 'Akt', {}),
+    ('sachs', 'Erk', {'PKA': 'HIGH', 'PKC': 'LOW'}),
+    ('insurance', 'Accident', {}),
+    ('insurance', 'PropCost', {'Age': 'Adult', 'DrivingSkill': 'Normal',
+                               'MakeModel': 'SportsCar', 'Mileage': 'FiftyThou'}),
+]
+
+HEURISTICS = ['least_incoming_arcs_first', 'fewest_factors_first', 'min_degree',
+              'min_fill', 'weighted_min_fill']
+
+BACKENDS = ['pandas', 'dense']
+
+
+def measure(ve: VariableElimination, query: str, evidence: dict, elim_heuristic,
+            repeat: int = 5, warmup: int = 1)->dict:
+    """
+    Times repeated runs of a query, after warmup runs which are not
+        timed, and measures the memory of one more run.
+
+    param ve: a VariableElimination object
+    param query: the query variable
+    param evidence: A dictionary of the observed variables {'variable': value}
+    param elim_heuristic: a heuristic function from heuristics.py
+    param repeat: number of timed runs
+    param warmup: number of runs before timing
+
+    returns dict of the minimum, median and mean seconds per run, the
+        peak bytes allocated through Python during a run (tracemalloc),
+        and the computations CostTracker counted in a run.
+    """
+    for _ in range(warmup):
+        ve.run(query, evidence, elim_heuristic, verbose=False)
+
+    seconds = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        ve.run(query, evidence, elim_heuristic, verbose=False)
+        seconds.append(time.perf_counter() - start)
+
+    # traced separately, since tracing slows allocation down
+    cost_tracker = CostTracker()
+    tracemalloc.start()
+    try:
+        ve.run(query, evidence, elim_heuristic, verbose=False, cost_tracker=cost_tracker)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {'min_seconds': min(seconds), 'median_seconds': statistics.median(seconds),
+            'mean_seconds': statistics.mean(seconds), 'peak_traced_bytes': peak,
+            'computations': cost_tracker.computations}
+
+
+def run_benchmarks(cases: list = CASES, heuristic_names: list = HEURISTICS,
+                   backends: list = BACKENDS, repeat: int = 5, warmup: int = 1,
+                   network_dir: str = NETWORK_DIR, verbose: bool = False, **options):
+    """
+    Benchmarks every combination of case, heuristic and backend.
+
+    param cases: list of (network name, query, evidence) tuples, where
+        the network is read from network_dir/<name>.bif
+    param heuristic_names: names of heuristic functions in heuristics.py
+    param backends: VariableElimination backends
+    param repeat: number of timed runs per combination
+    param warmup: number of untimed runs per combination
+    param network_dir: directory holding the .bif files
+    param verbose: if True, prints a line per combination
+    param options: further keyword arguments for VariableElimination
+
+    yields a dict per combination, holding the case, the measurements of
+        measure, and the rows and induced width of the largest
+        intermediate factor as VariableElimination.plan predicts them.
+        A failing combination holds its error instead.
+    """
+    networks = {}
+
+    for name, query, evidence in cases:
+
+        if name not in networks:
+            networks[name] = BayesNet(os.path.join(network_dir, name + '.bif'))
+
+        for backend in backends:
+            ve = VariableElimination(networks[name], backend=backend, **options)
+
+            for heuristic_name in heuristic_names:
+
+                result = {'network': name, 'query': query, 'evidence': evidence,
+                          'heuristic': heuristic_name, 'backend': backend,
+                          'repeat': repeat, 'error': None}
+
+                try:
+                    elim_heuristic = getattr(heuristics, heuristic_name)
+                    plan = ve.plan(query, evidence, elim_heuristic)
+                    result['largest_factor_rows'] = plan.max_rows
+                    result['induced_width'] = plan.induced_width
+                    result.update(measure(ve, query, evidence, elim_heuristic, repeat, warmup))
+                except Exception as error:
+                    result['error'] = "{}: {}".format(type(error).__name__, error)
+
+                if verbose:
+                    print("{network} {query} {heuristic} {backend}: ".format(**result) +
+                          (result['error'] or "{:.4f}s median".format(result['median_seconds'])))
+
+                yield result
+
+
+def environment()->dict:
+    """
+    Returns the versions results were measured with, and the process'
+        peak resident set size so far in KiB (None where unavailable).
+        The peak only ever grows while the process runs, so it is
+        recorded once for all results rather than per combination.
+    """
+    # kilobytes on Linux, bytes on macOS
+    max_rss = None
+    if resource is not None:
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        if sys.platform == 'darwin':
+            max_rss //= 1024
+
+    return {'python': platform.python_version(), 'numpy': np.__version__,
+            'pandas': pd.__version__, 'platform': platform.platform(),
+            'time': time.strftime("%Y-%m-%dT%H:%M:%S"), 'max_rss_kib': max_rss}
+
+
+def write_results(results: list, path: str)->None:
+    """
+    Writes results to a .csv file, with the evidence as JSON, or
+        otherwise to a JSON file along with the environment.
+    """
+    if path.endswith('.csv'):
+        table = pd.DataFrame(results)
+        table['evidence'] = table['evidence'].map(lambda e: json.dumps(e, sort_keys=True))
+        table.to_csv(path, index=False)
+    else:
+        with open(path, 'w') as file:
+            json.dump({'environment': environment(), 'results': results}, file, indent=1)
+
+    return None
+
+
+def read_results(path: str)->list:
+    """
+    Reads results written by write_results
+    """
+    if path.endswith('.csv'):
+        table = pd.read_csv(path)
+        table['evidence'] = table['evidence'].map(json.loads)
+        table = table.astype(object).where(table.notna(), None)
+        return table.to_dict('records')
+
+    with open(path) as file:
+        return json.load(file)['results']
+
+
+def compare(baseline: list, results: list, metric: str = 'median_seconds',
+            tolerance: float = 0.2)->list:
+    """
+    Finds the combinations whose metric grew by more than tolerance
+        (a fraction) relative to baseline, or which started failing.
+        The computations and largest factor of a combination do
+        not depend on timing, so any growth in those is reported.
+
+    param baseline: results of an earlier run_benchmarks
+    param results: results of a later run_benchmarks
+    param metric: timing or memory measurement to compare
+    param tolerance: allowed relative growth of metric
+
+    returns list of dicts with the combination, the compared measurement
+        and its baseline and new values
+    """
+    def key(result):
+        return (result['network'], result['query'], json.dumps(result['evidence'], sort_keys=True),
+                result['heuristic'], result['backend'])
+
+    earlier = {key(result): result for result in baseline}
+    regressions = []
+
+    for result in results:
+        before = earlier.get(key(result))
+        if before is None or before.get('error'):
+            continue
+
+        combination = dict(zip(['network', 'query', 'evidence', 'heuristic', 'backend'], key(result)))
+
+        if result.get('error'):
+            regressions.append(dict(combination, measurement='error',
+                                    baseline=None, value=result['error']))
+            continue
+
+        limits = {metric: before[metric] * (1 + tolerance),
+                  'computations': before['computations'],
+                  'largest_factor_rows': before['largest_factor_rows']}
+
+        for measurement, limit in limits.items():
+            if result[measurement] > limit:
+                regressions.append(dict(combination, measurement=measurement,
+                                        baseline=before[measurement], value=result[measurement]))
+
+    return regressions
+
+
+def main(argv: list = None)->int:
+    parser = argparse.ArgumentParser(description="Benchmark variable elimination "
+                                     "over networks, heuristics and backends.")
+    parser.add_argument('--networks', nargs='+',
+                        help="networks to benchmark; all in CASES by default")
+    parser.add_argument('--heuristics', nargs='+', default=HEURISTICS,
+                        help="heuristic functions from heuristics.py")
+    parser.add_argument('--backends', nargs='+', default=BACKENDS, choices=BACKENDS)
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per combination")
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs per combination")
+    parser.add_argument('--multiplication', default='pairwise',
+                        choices=['pairwise', 'joint', 'fused'])
+    parser.add_argument('--no-prune', action='store_true',
+                        help="do not prune irrelevant variables")
+    parser.add_argument('--output', help="file to write results to (.json or .csv)")
+    parser.add_argument('--compare', help="earlier results to compare against")
+    parser.add_argument('--metric', default='median_seconds',
+                        choices=['min_seconds', 'median_seconds', 'mean_seconds',
+                                 'peak_traced_bytes'],
+                        help="measurement compared with --compare")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed relative growth of the metric")
+    args = parser.parse_args(argv)
+
+    cases = [case for case in CASES if not args.networks or case[0] in args.networks]
+
+    results = list(run_benchmarks(cases, args.heuristics, args.backends, args.repeat,
+                                  args.warmup, verbose=True, prune=not args.no_prune,
+                                  multiplication=args.multiplication))
+
+    if args.output:
+        write_results(results, args.output)
+
+    if args.compare:
+        regressions = compare(read_results(args.compare), results, args.metric, args.tolerance)
+
+        for regression in regressions:
+            print("Regression in {network} {query} {evidence} {heuristic} {backend}: "
+                  "{measurement} {baseline} -> {value}".format(**regression))
+
+        # a non-zero exit status lets scripts detect regressions
+        return 1 if regressions else 0
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
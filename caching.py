@@ -0,0 +1,211 @@
+"""
+@Author: Harrison Froedge, Shenghang Wang
+
+Bounded caches used by VariableElimination to reuse work
+    across queries.
+"""
+import time
+from collections import OrderedDict
+
+
+class LRUCache():
+
+    def __init__(self, maxsize: int = 128):
+        """
+        A dictionary holding at most maxsize entries, which
+            evicts the least recently used entry when full.
+            Counts hits and misses of get.
+
+        param maxsize: maximum number of entries. 0 disables
+            the cache.
+        """
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+
+    def __len__(self)->int:
+        return len(self.entries)
+
+
+    def __contains__(self, key)->bool:
+        return key in self.entries
+
+
+    def get(self, key, default=None):
+        """
+        Returns the entry for key, marking it most recently
+            used, or default if there is none.
+        """
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+        self.misses += 1
+
+        return default
+
+
+    def put(self, key, value)->None:
+        """
+        Adds or replaces the entry for key, evicting the least
+            recently used entries while over maxsize.
+        """
+        self.entries[key] = value
+        self.entries.move_to_end(key)
+
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+        return None
+
+
+    def clear(self)->None:
+        """
+        Removes all entries. Hit and miss counts are kept.
+        """
+        self.entries.clear()
+
+        return None
+
+
+    @property
+    def hit_rate(self)->float:
+        """
+        Fraction of calls to get which found an entry
+        """
+        lookups = self.hits + self.misses
+
+        return self.hits / lookups if lookups else 0.0
+
+
+class MessageCache(LRUCache):
+
+    def __init__(self, max_bytes: int):
+        """
+        An LRUCache of the factors variable elimination produces by
+            marginalizing, bounded by the memory their tables take
+            up rather than by their number.
+
+        param max_bytes: maximum total size of the cached tables
+        """
+        super().__init__(maxsize=None)
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.sizes = {}
+
+
+    def put(self, key, factor)->None:
+        """
+        Adds or replaces the factor for key, evicting the least
+            recently used factors while over max_bytes. Factors
+            larger than max_bytes are not cached.
+        """
+        if hasattr(factor, 'table'):
+            nbytes = factor.table.nbytes
+        else:
+            nbytes = int(factor.cp_table.memory_usage(deep=True).sum())
+
+        if nbytes > self.max_bytes:
+            return None
+
+        if key in self.entries:
+            self.nbytes -= self.sizes[key]
+
+        self.entries[key] = factor
+        self.entries.move_to_end(key)
+        self.sizes[key] = nbytes
+        self.nbytes += nbytes
+
+        while self.nbytes > self.max_bytes:
+            evicted, _ = self.entries.popitem(last=False)
+            self.nbytes -= self.sizes.pop(evicted)
+
+        return None
+
+
+    def clear(self)->None:
+        """
+        Removes all entries. Hit and miss counts are kept.
+        """
+        self.entries.clear()
+        self.sizes.clear()
+        self.nbytes = 0
+
+        return None
+
+
+class ResultCache(LRUCache):
+
+    def __init__(self, maxsize: int = 1024, ttl: float = None, 
+                 ordering_independent: bool = True):
+        """
+        An LRUCache of the distributions VariableElimination.run
+            returns, which may be shared between VariableElimination
+            objects.
+
+        param maxsize: maximum number of cached distributions
+        param ttl: if given, seconds after which a cached distribution
+            is no longer returned
+        param ordering_independent: if True, distributions are shared
+            between runs with different heuristics, since the
+            ordering does not change the result. If False, every
+            heuristic has its own entries.
+        """
+        super().__init__(maxsize)
+        self.ttl = ttl
+        self.ordering_independent = ordering_independent
+
+
+    def key(self, network, query: str, observed: dict, elim_heuristic)->tuple:
+        """
+        Returns the key of a run: the network object, the query, the
+            evidence irrespective of its order and, unless
+            ordering_independent, the heuristic. The key holds the
+            network itself rather than its id, which a network
+            created after it is freed could reuse.
+        """
+        heuristic = None if self.ordering_independent else elim_heuristic
+
+        return network, query, frozenset(observed.items()), heuristic
+
+
+    def get(self, key, default=None):
+        """
+        Returns a copy of the distribution for key, or default if
+            there is none or it is older than ttl.
+        """
+        entry = super().get(key)
+
+        if entry is None:
+            return default
+
+        stored, distribution = entry
+
+        if self.ttl is not None and time.monotonic() - stored > self.ttl:
+            del self.entries[key]
+            self.hits -= 1
+            self.misses += 1
+            return default
+
+        return distribution.copy()
+
+
+    def put(self, key, distribution)->None:
+        """
+        Stores a copy of distribution for key.
+        """
+        return super().put(key, (time.monotonic(), distribution.copy()))
+
+
+    def invalidate(self, network)->None:
+        """
+        Removes all distributions of network, e.g., after its
+            probabilities changed.
+        """
+        for key in [k for k in self.entries if k[0] is network]:
+            del self.entries[key]
+
+        return None
@@ -0,0 +1,217 @@
+"""
+@Author: Harrison Froedge, Shenghang Wang
+
+Clique tree (junction tree) built from an elimination ordering,
+    used to compute the posterior of every variable with two
+    passes of message passing instead of one elimination per
+    variable.
+"""
+from __future__ import annotations
+from factors import DenseFactor, DenseFactorGroup
+
+
+class CliqueTree():
+
+    def __init__(self, factors: DenseFactorGroup, elim_order: list):
+        """
+        Builds a clique tree by simulating elimination of every
+            variable in factors on their scopes. Eliminating a
+            variable creates a clique over all variables of the
+            factors involving it. The original factors consumed
+            are assigned to that clique, and the factor it would
+            have produced becomes a message to the clique which
+            later consumes it, its parent.
+
+        param factors: reduced dense factors
+        param elim_order: elimination ordering; variables of factors
+            missing from it are eliminated last, in order of
+            first appearance.
+
+        Cliques are numbered in order of creation, so every clique
+            comes after all of its children.
+        """
+        self.values = factors.values
+
+        # scope, assigned factors, parent index and scope of the
+        # message to the parent (separator) per clique
+        self.cliques = []
+        self.assigned = []
+        self.parent = []
+        self.separators = []
+        self.children = []
+
+        # index of the clique in which each variable was eliminated
+        self.clique_of = {}
+
+        elim_order = list(elim_order) + [var for var in factors.getProductScope()
+                                         if var not in elim_order]
+
+        # factors and messages not yet consumed, as (scope, factor or
+        # index of sending clique)
+        pending = [(factor.scope, factor) for factor in factors.factors]
+
+        for X in elim_order:
+
+            involved = [item for item in pending if X in item[0]]
+            if not involved:
+                continue
+
+            pending = [item for item in pending if X not in item[0]]
+            i = len(self.cliques)
+
+            scope = list(dict.fromkeys(var for s, _ in involved for var in s))
+            self.cliques.append(scope)
+            self.assigned.append([f for _, f in involved if isinstance(f, DenseFactor)])
+            self.children.append([j for _, j in involved if not isinstance(j, DenseFactor)])
+            self.parent.append(None)
+            self.separators.append([var for var in scope if var != X])
+            self.clique_of[X] = i
+
+            for j in self.children[i]:
+                self.parent[j] = i
+
+            if self.separators[i]:
+                pending.append((self.separators[i], i))
+
+        # evidence factors per clique, by variable (see setEvidence)
+        self.evidence = [{} for _ in self.cliques]
+
+        # messages to the parent and from the parent per clique, or
+        # None until they are computed
+        self.up = [None] * len(self.cliques)
+        self.down = [None] * len(self.cliques)
+
+
+    def send(self, i: int, factors: list, separator: list)->DenseFactor:
+        """
+        Multiplies clique i's assigned and evidence factors with
+            the given factors (messages) and sums out every variable
+            not in separator.
+        """
+        group = DenseFactorGroup(self.values)
+        group.factors = self.assigned[i] + list(self.evidence[i].values()) + factors
+
+        summed = [var for var in group.getProductScope() if var not in separator]
+
+        if not summed:
+            return group.multiply()
+
+        # the product over the whole clique is never built
+        return group.multiplyAndMarginalize(*summed)
+
+
+    def upward(self, i: int)->DenseFactor:
+        """
+        Returns the message from clique i to its parent, first
+            computing it and the messages below it which are not
+            known yet.
+        """
+        missing = []
+        stack = [i]
+        while stack:
+            j = stack.pop()
+            if self.up[j] is None:
+                missing.append(j)
+                stack.extend(self.children[j])
+
+        # children come before their parents
+        for j in sorted(missing):
+            self.up[j] = self.send(j, [self.up[c] for c in self.children[j]],
+                                   self.separators[j])
+
+        return self.up[i]
+
+
+    def downward(self, i: int)->DenseFactor:
+        """
+        Returns the message from the parent of clique i to clique i,
+            first computing it and the messages it depends on which
+            are not known yet.
+        """
+        missing = []
+        j = i
+        while self.parent[j] is not None and self.down[j] is None:
+            missing.append(j)
+            j = self.parent[j]
+
+        # from the root down
+        for j in reversed(missing):
+            p = self.parent[j]
+            incoming = [] if self.parent[p] is None else [self.down[p]]
+            others = [self.upward(k) for k in self.children[p] if k != j]
+            self.down[j] = self.send(p, incoming + others, self.separators[j])
+
+        return self.down[i]
+
+
+    def calibrate(self)->CliqueTree:
+        """
+        Passes messages from the leaves up to the roots, and
+            then from the roots back down to the leaves, after
+            which every clique has received a message from all
+            of its neighbours.
+        """
+        for i in range(len(self.cliques)):
+            if self.parent[i] is not None:
+                self.downward(i)
+
+        return self
+
+
+    def setEvidence(self, variable: str, factor: DenseFactor = None)->None:
+        """
+        Sets the evidence factor on variable, e.g., an indicator of
+            its observed value, or removes it if factor is None.
+            Forgets the messages which depend on it: those sent up
+            from its clique to the root, and those sent down to any
+            clique but its clique and the cliques above it. They are
+            computed again when they are next needed.
+
+        param variable: a variable of the tree
+        param factor: dense factor over variable alone, or None
+        """
+        i = self.clique_of[variable]
+
+        if factor is None:
+            self.evidence[i].pop(variable, None)
+        else:
+            self.evidence[i][variable] = factor
+
+        above = set()
+        while i is not None:
+            above.add(i)
+            self.up[i] = None
+            i = self.parent[i]
+
+        for j in range(len(self.cliques)):
+            if j not in above:
+                self.down[j] = None
+
+        return None
+
+
+    def belief(self, i: int)->DenseFactor:
+        """
+        Returns the (unnormalized) joint distribution of clique i's
+            variables given the evidence, computing the messages to
+            clique i which are not known yet.
+        """
+        incoming = [self.upward(c) for c in self.children[i]]
+        if self.parent[i] is not None:
+            incoming.append(self.downward(i))
+
+        return self.send(i, incoming, self.cliques[i])
+
+
+    def marginal(self, variable: str)->DenseFactor:
+        """
+        Returns the normalized posterior distribution of variable,
+            from the belief of the clique it was eliminated in.
+        """
+        belief = self.belief(self.clique_of[variable])
+
+        others = [var for var in belief.scope if var != variable]
+        if others:
+            belief.marginalize(*others)
+
+        return belief.normalize()
@@ -6,13 +6,40 @@ from __future__ import annotations
 import pandas as pd
 import itertools
 import numpy as np
-from copy import deepcopy
+from copy import copy, deepcopy
 from warnings import warn
+from read_bayesnet import code_dtype
+
+
+class FactorBudgetError(MemoryError):
+    
+    def __init__(self, rows: int, max_rows: int, scope: list):
+        """
+        Raised instead of allocating a factor with more rows
+            than the configured budget allows.
+            
+        param rows: number of rows the factor would have
+        param max_rows: the budget
+        param scope: variables of the factor
+        """
+        super().__init__("Factor over {} would have {} rows,".format(scope, rows) +
+                         " exceeding the budget of {} rows".format(max_rows))
+        self.rows = rows
+        self.max_rows = max_rows
+        self.scope = scope
+
+
+def holds_codes(values: list)->bool:
+    """
+    Returns whether a variable's values are the codes 0 to k - 1
+        (see BayesNet.codes), which are their own positions
+    """
+    return values == list(range(len(values)))
 
 
 class FactorGroup():
     
-    def __init__(self, values: dict, *factors:Factor):
+    def __init__(self, values: dict, *factors:Factor, max_rows:int = None):
         """
         Defines a group of factors and relevant operations
             which can be applied on that group.
@@ -23,36 +50,81 @@ class FactorGroup():
             variables are removed.
             
         param factors: factors to include in the group
+        
+        param max_rows: if given, multiply raises FactorBudgetError
+            rather than produce a factor with more rows. Groups
+            extracted from this one inherit the budget.
+            
+        A factor's scope must not change while it is in the group,
+            since the group indexes its factors by their variables.
         """
         self.values = values
-        self.factors = []
-        self.append(factors)
+        self.factors = list(factors)
+        self.max_rows = max_rows
         
         # defined by approximate row/column operations in
         # multiply and marginalize        
         self.computations = 0
         
     
+    @property
+    def factors(self)->tuple:
+        """
+        Factors in the group, in the order they were appended. Read
+            only, so that the index is not bypassed: use append,
+            extractInvolving or assign a new list instead.
+        """
+        return tuple(self.entries.values())
+    
+    
+    @factors.setter
+    def factors(self, factors:list)->None:
+        
+        # factors by a key increasing in order of appending, and the
+        # keys of the factors involving each variable, in that order
+        self.entries = {}
+        self.involving = {}
+        self.next_key = 0
+        
+        self.append(*factors)
+    
+    
     def append(self, *factors:Factor)->None:
         """
         Adds an aribtrary number of factors to the
             end of the factors list.
         """
-        if factors[0]:
-            
-            for factor in factors:
+        for factor in factors:
 
-                if not isinstance(factor, Factor):
+            if not isinstance(factor, self.factor_type):
 
-                        raise ValueError("Can only append items of type Factor" +
-                                         " to FactorGroup, not " +
-                                         "{}".format(type(factor)))
+                    raise ValueError("Can only append items of type " +
+                                     "{} ".format(self.factor_type.__name__) +
+                                     "to {}, not ".format(type(self).__name__) +
+                                     "{}".format(type(factor)))
 
-                self.factors.append(factor)
+            key = self.next_key
+            self.next_key += 1
+            
+            self.entries[key] = factor
+            for var in factor.scope:
+                self.involving.setdefault(var, {})[key] = None
         
         return None
     
     
+    def __len__(self)->int:
+        return len(self.entries)
+    
+    
+    @property
+    def factor_type(self)->type:
+        """
+        Type of factor this group holds
+        """
+        return Factor
+    
+    
     def extractInvolving(self, var: str)->FactorGroup:
         """
         Collects all factors which contain var in their
@@ -64,17 +136,22 @@ class FactorGroup():
             
         returns new FactorGroup with factors involving variable
         """
-        Rs = FactorGroup(self.values)
-        updated_factors = []
+        Rs = type(self)(self.values, max_rows=self.max_rows)
         
-        for factor in self.factors:
+        # only the factors involving var, and the index entries of
+        # their other variables, are touched
+        for key in self.involving.pop(var, {}):
             
-            if var in factor.cp_table:
-                Rs.append(factor)
-            else:
-                updated_factors.append(factor)
-                
-        self.factors = updated_factors
+            factor = self.entries.pop(key)
+            
+            for other in factor.scope:
+                if other != var:
+                    keys = self.involving[other]
+                    del keys[key]
+                    if not keys:
+                        del self.involving[other]
+                        
+            Rs.append(factor)
         
         return Rs
     
@@ -94,16 +171,44 @@ class FactorGroup():
         returns set of variables involved in the FactorGroup's
             cp_tables (without duplicates if get_uniques=True)
         """
-        variables = [item for sublist in [
-            list(f.cp_table.drop(columns=["prob"]).columns) 
-            for f in self.factors] for item in sublist]
-
         if not include_duplicates:
-            variables = list(set(variables))
+            return list(self.involving)
         
-        return variables
+        return [var for factor in self.entries.values() for var in factor.scope]
+    
+    
+    def countInvolving(self, var: str)->int:
+        """
+        Returns the number of factors which contain var
+        """
+        return len(self.involving.get(var, ()))
         
     
+    def countRows(self, scope: list)->int:
+        """
+        Returns the number of rows of a factor over scope
+        """
+        return int(np.prod([len(self.values[k]) for k in scope], dtype=float))
+    
+    
+    def checkProductSize(self, scope: list)->None:
+        """
+        Raises FactorBudgetError if a factor over scope would
+            have more rows than self.max_rows allows.
+            
+        param scope: variables of the factor about to be allocated
+        """
+        if self.max_rows is None:
+            return None
+        
+        rows = self.countRows(scope)
+        
+        if rows > self.max_rows:
+            raise FactorBudgetError(rows, self.max_rows, scope)
+            
+        return None
+    
+    
     def getProductTable(self, Rs: list)->pd.DataFrame:
         """
         Generates table which results from multiplying given factors.
@@ -118,12 +223,26 @@ class FactorGroup():
             values in the prob column left undeclared.
         """
         new_column_names = self.getAllVarNames()
+        self.checkProductSize(new_column_names)
         
-        vals = {k: self.values[k] for k in new_column_names}
+        if not new_column_names:
+            return pd.DataFrame(columns=[], data=[()])
+        
+        # position of each variable's value per row, the last variable's
+        # changing fastest as in itertools.product
+        shape = [len(self.values[k]) for k in new_column_names]
+        positions = np.indices(shape).reshape(len(shape), -1)
 
-        table = pd.DataFrame(columns=new_column_names, data=list(itertools.product(*vals.values())))
+        table = {}
+        for i, k in enumerate(new_column_names):
+            if holds_codes(self.values[k]):
+                # values which are codes (see BayesNet.codes) are their
+                # own positions, kept as small as the network's CPTs
+                table[k] = positions[i].astype(code_dtype(shape[i]))
+            else:
+                table[k] = pd.Index(self.values[k]).take(positions[i])
 
-        return table
+        return pd.DataFrame(table)
     
     
     def multiply(self)->Factor:
@@ -143,32 +262,136 @@ class FactorGroup():
         
         returns a new factor: the product of factors
         """        
-        product = Factor("", self.getProductTable(self.factors))
+        product = Factor("", self.getProductTable(list(self.entries.values())), self.values)
         
         # JOINs factors with product table
         
-        # Extends each factor to have n^v rows, where each row in product
-        # with variable values matching a row in the factor are duplicated
-        # (but only with the columns existing in that factor).
-        # This means that each factor will have the same number of rows as
-        # product, and their row indices exactly correspond to product's.
-        # These extensions are stored in merges
-        merges = [product.merge(factor) for factor in self.factors]
+        # Rather than merging on the variables' values, the values of
+        # every row are turned into their positions in self.values
+        # (which for the codes VariableElimination's 'pandas' backend
+        # uses are the codes themselves). Each factor's probabilities
+        # are laid out in an array indexed by the flat (mixed radix)
+        # position of their row, in which every row of product looks
+        # up its matching probability. Combinations missing from a
+        # factor get NaN, as a left merge would give them.
+        positions = {k: self.getPositions(product.cp_table, k) for k in product.scope}
+        prob_products = np.ones(product.size)
         
-        # multiplies probabilities of resulting merges together row-by-row 
-        # across every extended factor in merge.
-        prob_products = []
-        for index, row in product.iterrows():
-            prob_products.append(np.product([cp_table['prob'].iloc[index] for cp_table in merges]))
+        for factor in self.entries.values():
+            dims = [len(self.values[k]) for k in factor.scope]
+            
+            lookup = np.full(int(np.prod(dims)), np.nan)
+            rows = np.ravel_multi_index([self.getPositions(factor.cp_table, k) 
+                                         for k in factor.scope], dims)
+            lookup[rows] = factor.cp_table['prob'].to_numpy(dtype=float)
+            
+            prob_products *= lookup[np.ravel_multi_index([positions[k] for k in factor.scope], 
+                                                         dims)]
         
         product.cp_table['prob'] = prob_products
+        product.sources = frozenset().union(*[f.sources for f in self.entries.values()])
         
         return product
+    
+    
+    def getPositions(self, cp_table: pd.DataFrame, var: str)->np.ndarray:
+        """
+        Returns the position in self.values of the value of var
+            in every row of cp_table
+        """
+        if holds_codes(self.values[var]):
+            return cp_table[var].to_numpy()
+        
+        return pd.Index(self.values[var]).get_indexer(cp_table[var])
+    
+    
+    def multiplyPairwise(self, *variables:str)->Factor:
+        """
+        Multiplies all factors two at a time rather than all at
+            once, in the spirit of join ordering: each time, the two
+            factors whose product has the fewest rows are multiplied,
+            so small factors are combined before they are expanded
+            to the scope of larger ones. Each of variables is summed
+            out as soon as a single factor left contains it.
+            
+        param variables: variables to sum out of the product, if any
+        
+        returns a new factor: the product of factors, with variables
+            summed out
+        """
+        if not self.entries:
+            return self.multiply()
+        
+        originals = list(self.entries.values())
+        factors = [self.sumOutFinished(f, originals[:i] + originals[i + 1:], variables)
+                   for i, f in enumerate(originals)]
+        
+        while len(factors) > 1:
+            
+            i, j = min(itertools.combinations(range(len(factors)), 2),
+                       key=lambda pair: self.countRows(set(factors[pair[0]].scope) | 
+                                                       set(factors[pair[1]].scope)))
+            
+            product = type(self)(self.values, factors[i], factors[j], 
+                                 max_rows=self.max_rows).multiply()
+            factors = [f for k, f in enumerate(factors) if k not in (i, j)]
+            factors.append(self.sumOutFinished(product, factors, variables))
+        
+        product = factors[0]
+        
+        # the product of a single factor is a new factor all the same
+        return copy(product) if any(product is f for f in originals) else product
+    
+    
+    def sumOutFinished(self, factor:Factor, others:list, variables:tuple)->Factor:
+        """
+        Sums out of factor those of variables which no factor in
+            others contains. Variables are only summed out to a
+            factor over no variables at all when others is empty,
+            since such a factor no longer holds its total.
+            
+        param factor: factor to sum variables out of; left unchanged
+        param others: factors still to be multiplied with factor
+        param variables: variables to sum out of the product
+        
+        returns factor, or a new factor with variables summed out
+        """
+        finished = [var for var in variables if var in factor.scope and 
+                    not any(var in f.scope for f in others)]
+        
+        if not finished or (len(finished) == len(factor.scope) and others):
+            return factor
+        
+        return copy(factor).marginalize(*finished)
+    
+    
+    def multiplyAndMarginalize(self, *variables:str)->Factor:
+        """
+        Multiplies all factors and sums variables out of the
+            product. Long format tables can only be multiplied
+            by joining them, so this multiplies pairwise (see
+            multiplyPairwise); DenseFactorGroup contracts the
+            tables without building the product.
+            
+        param variables: one or more variables to sum out
+        
+        returns a new factor: the product of factors, with variables
+            summed out
+        """
+        scope = self.getAllVarNames()
+        
+        if not variables or any(var not in scope for var in variables):
+            raise ValueError("Something went wrong." +
+                             " Variable to be eliminated not found in factors")
+            
+        return self.multiplyPairwise(*variables)
         
         
 class Factor():
     
-    def __init__(self, name: str, cp_table: pd.DataFrame):
+    __slots__ = ('name', 'sources', '_cp_table', '_scope', 'values')
+    
+    def __init__(self, name: str, cp_table: pd.DataFrame, values: dict = None):
         """
         Defines a factor, used to represent nodes in a 
             Bayesian network and to perform variable
@@ -178,9 +401,50 @@ class Factor():
             the factor. Can be the names given in network.nodes.
         param cpt: Conditional Probability Table for a
             node in the network
+        param values: if given, dict of possible values of (at least)
+            the variables of the table. {'variable':[possible values]}
+            Columns of variables whose values are codes are then
+            marginalized by their codes, without hashing.
         """
         self.name = name
         self.cp_table = cp_table
+        self.values = values
+        
+        # names of the network's factors this factor was computed from
+        self.sources = frozenset([name]) if name else frozenset()
+    
+    
+    @property
+    def cp_table(self)->pd.DataFrame:
+        """
+        The factor's conditional probability table
+        """
+        return self._cp_table
+    
+    
+    @cp_table.setter
+    def cp_table(self, cp_table: pd.DataFrame)->None:
+        self._cp_table = cp_table
+        self._scope = tuple(c for c in cp_table.columns if c != 'prob')
+    
+    
+    @property
+    def scope(self)->tuple:
+        """
+        Variables (column names, excluding 'prob') the factor's
+            conditional probability table is defined over.
+            Computed once per table.
+        """
+        return self._scope
+    
+    
+    @property
+    def size(self)->int:
+        """
+        Number of rows in the factor's conditional
+            probability table.
+        """
+        return self.cp_table.shape[0]
     
     
     def normalize(self)->Factor:
@@ -204,28 +468,41 @@ class Factor():
         return self
     
     
-    def marginalize(self, variable:str)->Factor:
+    def marginalize(self, *variables:str)->Factor:
         """
         The elimination step of variable elimination. Sums out
-        a variable from a given factor by summing the probabilities
-        of rows which are identical except for the value of the
-        passed variable to make a single row. The summed rows,
-        along with the column of the subject variable, are discarded.
+        variables from a given factor by summing the probabilities
+        of rows which are identical except for the values of the
+        passed variables to make a single row. The summed rows,
+        along with the columns of the subject variables, are discarded.
+        
+        Each remaining column is coded as integers, the codes
+        are combined into a single flat (mixed radix) row key and
+        probabilities are summed per key with np.bincount, so no
+        grouping of rows by their string values is needed. Columns
+        which already hold codes (see BayesNet.codes), as with
+        VariableElimination's 'pandas' backend, are used as they
+        are, so no hashing is needed either.
 
-        param variable: a variable in the factor to be eliminated.
+        param variables: one or more variables in the factor
+            to be eliminated.
 
-        Results in a new cp_table with the subject variable's column
-            summed out and with reduced rows. For an initial
-            cp_table of size v x n, the resulting cp_table will be 
-            of size (v-1) x (n/2).
+        Results in a new cp_table with the subject variables' columns
+            summed out and with reduced rows. Remaining columns keep
+            their original order. For an initial cp_table of size 
+            v x n, summing out one binary variable results in a 
+            cp_table of size (v-1) x (n/2).
         """
-        if variable not in self.cp_table:
+        if not variables or any(var not in self.scope for var in variables):
             raise ValueError("Something went wrong." +
                              " Variable to be eliminated not found in factor")
+        
+        # remaining columns, in their original order
+        keep = [c for c in self.scope if c not in variables]
             
-        if len(self.cp_table.columns) <= 2:
+        if not keep:
             
-            # summing over a factor with only one variable will
+            # summing over every variable of a factor will
             # completely eliminate it, so return empty df to
             # indicate that nothing should now be added to
             # the factor dictionary
@@ -233,24 +510,49 @@ class Factor():
             summed_f = pd.DataFrame()
             
         else:
-            # get list of columns minus variable and prob column
-            groupby = list(set(self.cp_table.columns).difference(set([variable,'prob'])))
-            reindex = groupby + ['prob']
-            agg_funcs = {c:'first' for c in groupby}
-            agg_funcs['prob'] = 'sum'
-
-            # will 'merge' rows together and sum their probabilities
-            # if every value in each column specified by groupby is
-            # equivalent
-            summed_f = self.cp_table.groupby(groupby).aggregate(
-                agg_funcs).reset_index(level=[i for i in range(
-                len(groupby))], drop=True)
+            # code each remaining column; labels[i][codes[i]] 
+            # recovers the column's values. Columns holding codes
+            # already are their own codes, otherwise they are
+            # factorized
+            codes, labels = [], []
+            for c in keep:
+                if self.values is not None and holds_codes(self.values[c]):
+                    codes.append(self.cp_table[c].to_numpy())
+                    labels.append(None)
+                else:
+                    column_codes, column_labels = pd.factorize(self.cp_table[c])
+                    codes.append(column_codes)
+                    labels.append(column_labels)
+                    
+            dims = [len(self.values[c]) if l is None else len(l) for c, l in zip(keep, labels)]
+            
+            # rows which are identical except for the summed out
+            # variables share a key
+            keys = np.ravel_multi_index(codes, dims)
+            prob = self.cp_table['prob'].to_numpy(dtype=float)
+            
+            summed = np.bincount(keys, weights=prob, minlength=int(np.prod(dims)))
+            occurring = np.flatnonzero(np.bincount(keys, minlength=summed.size))
+            
+            summed_codes = np.unravel_index(occurring, dims)
+            summed_f = pd.DataFrame({c: summed_codes[i].astype(code_dtype(dims[i])) 
+                                     if labels[i] is None else labels[i].take(summed_codes[i])
+                                     for i, c in enumerate(keep)})
+            summed_f['prob'] = summed[occurring]
 
         self.cp_table = summed_f
         
         return self
     
     
+    def head(self, n: int)->pd.DataFrame:
+        """
+        Returns the first n rows of the factor's
+            conditional probability table
+        """
+        return self.cp_table.head(n)
+    
+    
     def merge(self, factor: Factor)->Factor:
         """
         Applies a merge with factor without affecting the
@@ -266,4 +568,327 @@ class Factor():
         Returns an iterrows generator for the factor's
             conditional probability table
         """
-        return self.cp_table.iterrows()
\ No newline at end of file
+        return self.cp_table.iterrows()
+
+
+class DenseFactorGroup(FactorGroup):
+    
+    def __init__(self, values: dict, *factors:DenseFactor, max_rows:int = None):
+        """
+        Defines a group of dense factors. Shares the interface
+            of FactorGroup, but multiplies by broadcasting the
+            factors' tables against each other rather than by
+            building and merging a cartesian product table.
+        
+        param values: dict of possible values the variables
+            initially included in this FactorGroup can take on.
+            {'variable':[possible values]}
+            
+        param factors: dense factors to include in the group
+        
+        param max_rows: if given, multiply raises FactorBudgetError
+            rather than produce a factor with more rows.
+        """
+        super().__init__(values, *factors, max_rows=max_rows)
+        
+    
+    @property
+    def factor_type(self)->type:
+        """
+        Type of factor this group holds
+        """
+        return DenseFactor
+    
+    
+    def getProductScope(self)->list:
+        """
+        Returns the variables of every factor in the group,
+            without duplicates, in order of first appearance.
+            This is the scope (and axis order) of the product
+            of the group.
+        """
+        return list(dict.fromkeys(self.getAllVarNames(include_duplicates=True)))
+    
+    
+    def multiply(self)->DenseFactor:
+        """
+        Multiplies all factors in the group. Each factor's table
+            is transposed into the axis order of the product scope,
+            with length-one axes inserted for the variables it does
+            not contain, so that numpy broadcasting lines up matching
+            variable values and the whole product is computed at once.
+        
+        returns a new dense factor: the product of factors
+        """
+        scope = self.getProductScope()
+        self.checkProductSize(scope)
+        table = np.ones(())
+        
+        for factor in self.entries.values():
+            table = table * factor.expand(scope)
+            
+        product = DenseFactor("", scope, table, self.values)
+        product.sources = frozenset().union(*[f.sources for f in self.entries.values()])
+        
+        return product
+    
+    
+    def multiplyAndMarginalize(self, *variables:str)->DenseFactor:
+        """
+        Multiplies all factors and sums variables out of the
+            product in a single contraction with numpy.einsum,
+            which picks an order of pairwise contractions and
+            sums every variable out as early as it can. The
+            product over the whole scope is never allocated, so
+            only the result counts against max_rows.
+            
+        param variables: one or more variables in the group
+            to be eliminated.
+        
+        returns a new dense factor: the product of factors, with
+            variables summed out
+        """
+        scope = self.getProductScope()
+        
+        # einsum labels axes with at most 52 distinct subscripts
+        if not variables or any(var not in scope for var in variables) or len(scope) > 52:
+            return super().multiplyAndMarginalize(*variables)
+        
+        kept = [var for var in scope if var not in variables]
+        self.checkProductSize(kept)
+        
+        operands = []
+        for factor in self.entries.values():
+            operands += [factor.table, [scope.index(var) for var in factor.scope]]
+            
+        table = np.einsum(*operands, [scope.index(var) for var in kept], optimize='greedy')
+        
+        result = DenseFactor("", kept, table, self.values)
+        result.sources = frozenset().union(*[f.sources for f in self.entries.values()])
+        
+        return result
+    
+    
+class DenseFactor(Factor):
+    
+    __slots__ = ('table', 'values')
+    
+    def __init__(self, name: str, scope: list, table: np.ndarray, values: dict):
+        """
+        Defines a factor stored as a dense N-dimensional array,
+            with one axis per variable in scope. table[i, j, ...]
+            holds the probability of the i-th value of scope[0],
+            the j-th value of scope[1], and so on, where values
+            are ordered as in the values dict.
+            
+        param name: a name with which to reference
+            the factor. Can be the names given in network.nodes.
+        param scope: ordered list of the variables of the factor,
+            one per axis of table.
+        param table: array of probabilities
+        param values: dict of possible values of (at least) the
+            variables in scope. {'variable':[possible values]}
+        """
+        table = np.asarray(table, dtype=float)
+        
+        if table.ndim != len(scope):
+            raise ValueError("Dense factor table has {} axes".format(table.ndim) +
+                             " but scope has {} variables".format(len(scope)))
+        
+        self.name = name
+        self._scope = tuple(scope)
+        self.table = table
+        self.values = values
+        
+        # names of the network's factors this factor was computed from
+        self.sources = frozenset([name]) if name else frozenset()
+        
+        
+    @classmethod
+    def from_cp_table(cls, name: str, cp_table: pd.DataFrame, values: dict)->DenseFactor:
+        """
+        Builds a dense factor from a long format conditional
+            probability table, as stored in BayesNet.probabilities.
+            Value combinations missing from cp_table are given
+            probability 0.
+            
+        param name: name of the new factor
+        param cp_table: table with one column per variable and a
+            'prob' column
+        param values: dict of possible values per variable
+        
+        returns new DenseFactor with the columns of cp_table as scope
+        """
+        scope = [c for c in cp_table.columns if c != 'prob']
+        table = np.zeros([len(values[var]) for var in scope])
+        
+        index = tuple(pd.Categorical(cp_table[var], categories=values[var]).codes 
+                      for var in scope)
+        table[index] = cp_table['prob'].to_numpy(dtype=float)
+        
+        return cls(name, scope, table, values)
+    
+    
+    @property
+    def scope(self)->tuple:
+        """
+        Variables the factor is defined over, in axis order.
+        """
+        return self._scope
+    
+    
+    @property
+    def size(self)->int:
+        """
+        Number of rows the factor's cp_table has. As with Factor,
+            a factor with every variable summed out has none.
+        """
+        return self.table.size if self._scope else 0
+    
+    
+    @property
+    def cp_table(self)->pd.DataFrame:
+        """
+        The factor as a long format conditional probability table,
+            with one column per variable and a 'prob' column, rows
+            enumerating value combinations in the same order as
+            FactorGroup.getProductTable.
+        """
+        if not self._scope:
+            return pd.DataFrame()
+        
+        vals = [self.values[var] for var in self._scope]
+        table = pd.DataFrame(columns=self._scope, data=list(itertools.product(*vals)))
+        table['prob'] = self.table.ravel()
+        
+        return table
+    
+    
+    def head(self, n: int)->pd.DataFrame:
+        """
+        Returns the first n rows of the factor's cp_table,
+            without building the rest of it.
+        """
+        if not self._scope:
+            return pd.DataFrame()
+        
+        rows = np.arange(min(n, self.table.size))
+        codes = np.unravel_index(rows, self.table.shape)
+        
+        head = pd.DataFrame({var: np.array(self.values[var], dtype=object)[codes[i]] 
+                             for i, var in enumerate(self._scope)})
+        head['prob'] = self.table.ravel()[rows]
+        
+        return head
+    
+    
+    def expand(self, scope: list)->np.ndarray:
+        """
+        Returns a view of the factor's table with its axes
+            transposed into the order of scope, and length-one
+            axes for variables in scope that are not in the factor,
+            such that it broadcasts against tables over scope.
+            
+        param scope: ordered superset of the factor's scope
+        """
+        order = sorted(range(len(self._scope)), key=lambda i: scope.index(self._scope[i]))
+        shape = [self.table.shape[self._scope.index(var)] if var in self._scope else 1 
+                 for var in scope]
+        
+        return self.table.transpose(order).reshape(shape)
+    
+    
+    def reduce(self, observed: dict)->DenseFactor:
+        """
+        Reduces the factor on the given evidence by indexing
+            the observed value along each observed variable's
+            axis, dropping that axis. Variables not in the
+            factor are ignored.
+            
+        param observed: A dictionary of the observed variables {'variable': value}
+        
+        returns a new DenseFactor over the unobserved variables
+        
+        raises ValueError for a value the variable cannot take on, as
+            BayesNet.encode does
+        """
+        index = []
+        for var in self._scope:
+            if var not in observed:
+                index.append(slice(None))
+            elif observed[var] in self.values[var]:
+                index.append(self.values[var].index(observed[var]))
+            else:
+                raise ValueError("Unknown value {} for {}. ".format(observed[var], var) +
+                                 "Expected one of {}".format(self.values[var]))
+        index = tuple(index)
+        scope = [var for var in self._scope if var not in observed]
+        
+        return DenseFactor(self.name, scope, self.table[index], self.values)
+    
+    
+    def reduceBatch(self, observed_codes: dict, batch_var: str)->DenseFactor:
+        """
+        Reduces the factor on a batch of evidence at once. The
+            observed axes are replaced by a single leading axis
+            over the batch, so that entry b of the result is the
+            factor reduced on the b-th evidence row. Factors without
+            observed variables are returned unchanged.
+            
+        param observed_codes: dict of observed variables mapping to 
+            arrays of the positions of their observed values in 
+            self.values, one per evidence row {'variable': np.array}
+        param batch_var: name of the batch axis, which self.values 
+            should list the evidence rows for.
+            
+        returns a new DenseFactor over [batch_var] + the unobserved 
+            variables
+        """
+        observed = [i for i, var in enumerate(self._scope) if var in observed_codes]
+        
+        if not observed:
+            return self
+        
+        hidden = [i for i in range(len(self._scope)) if i not in observed]
+        index = tuple(observed_codes[self._scope[i]] for i in observed)
+        scope = [batch_var] + [self._scope[i] for i in hidden]
+        
+        return DenseFactor(self.name, scope, self.table.transpose(observed + hidden)[index], 
+                           self.values)
+    
+    
+    def normalize(self)->DenseFactor:
+        """
+        Normalizes the factor's table such that it's total
+            probability sums to one.
+        """
+        if len(self._scope) > 1:
+            warn("Normalizing factor with conditional probabilities" +
+                " may not be mathematically consistent")
+            
+        self.table = self.table / self.table.sum()
+        
+        return self
+    
+    
+    def marginalize(self, *variables:str)->DenseFactor:
+        """
+        The elimination step of variable elimination. Sums out
+            variables by reducing the table over their axes.
+            
+        param variables: one or more variables in the factor
+            to be eliminated.
+        
+        Results in a table with one axis fewer per variable. Summing 
+            out every variable leaves an empty scope, which
+            VariableElimination treats as an eliminated factor.
+        """
+        if not variables or any(var not in self._scope for var in variables):
+            raise ValueError("Something went wrong." +
+                             " Variable to be eliminated not found in factor")
+            
+        axes = tuple(self._scope.index(var) for var in variables)
+        self.table = self.table.sum(axis=axes)
+        self._scope = tuple(var for var in self._scope if var not in variables)
+        
+        return self
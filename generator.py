@@ -0,0 +1,157 @@
+"""
+@Author: Harrison Froedge, Shenghang Wang
+
+Generates random Bayesian networks for scaling experiments, as
+    .bif text in the format of the files in network_files, or
+    as BayesNet objects.
+
+Usage:
+    python generator.py 500 --max-parents 3 --treewidth 8 --seed 1 -o net500.bif
+"""
+import sys
+import argparse
+import itertools
+import numpy as np
+from read_bayesnet import BayesNet
+
+
+def random_structure(num_nodes: int, max_parents: int = 3, treewidth: int = None,
+                     rng: np.random.Generator = None)->list:
+    """
+    Draws a random DAG over nodes 0 to num_nodes - 1, in topological
+        order. Each node gets between 0 and max_parents parents,
+        uniformly, drawn from the treewidth nodes before it. Every
+        edge of the moral graph then joins nodes at most treewidth
+        apart, so its treewidth is at most treewidth.
+
+    param num_nodes: number of nodes
+    param max_parents: largest in-degree of a node
+    param treewidth: if given, bound on the treewidth of the moral
+        graph, at least max_parents. Parents are drawn from all
+        earlier nodes otherwise.
+    param rng: numpy random Generator
+
+    returns list of the parents of each node, as sorted lists of indices
+    """
+    if treewidth is not None and treewidth < max_parents:
+        raise ValueError("treewidth {} is smaller than ".format(treewidth) +
+                         "max_parents {}".format(max_parents))
+
+    rng = rng or np.random.default_rng()
+    parents = []
+
+    for node in range(num_nodes):
+        first = 0 if treewidth is None else max(0, node - treewidth)
+        candidates = np.arange(first, node)
+        k = rng.integers(0, min(max_parents, len(candidates)) + 1)
+        parents.append(sorted(int(p) for p in rng.choice(candidates, size=k, replace=False)))
+
+    return parents
+
+
+def random_bif(num_nodes: int, cardinality=2, max_parents: int = 3, treewidth: int = None,
+               seed: int = None, name: str = None, concentration: float = 1.0)->str:
+    """
+    Generates the .bif text of a random Bayesian network.
+
+    param num_nodes: number of variables
+    param cardinality: number of values per variable, or a (low, high)
+        range from which every variable's number of values is drawn
+    param max_parents: largest number of parents of a variable
+    param treewidth: if given, bound on the treewidth of the moral
+        graph (see random_structure)
+    param seed: seed of the random number generator; the same
+        arguments and seed give the same network
+    param name: name of the network
+    param concentration: parameter of the symmetric Dirichlet
+        distribution the rows of the CPTs are drawn from. Small
+        values give nearly deterministic rows.
+
+    returns the network as .bif text
+    """
+    rng = np.random.default_rng(seed)
+    parents = random_structure(num_nodes, max_parents, treewidth, rng)
+
+    if np.ndim(cardinality) == 0:
+        cardinalities = [int(cardinality)] * num_nodes
+    else:
+        low, high = cardinality
+        cardinalities = rng.integers(low, high + 1, size=num_nodes).tolist()
+
+    width = len(str(num_nodes - 1))
+    names = ["X{}".format(str(i).zfill(width)) for i in range(num_nodes)]
+    values = [["s{}".format(j) for j in range(n)] for n in cardinalities]
+
+    lines = ["network {} {{".format(name or "random{}".format(num_nodes)), "}"]
+
+    for i in range(num_nodes):
+        lines += ["variable {} {{".format(names[i]),
+                  "  type discrete [ {} ] {{ {} }};".format(cardinalities[i], ", ".join(values[i])),
+                  "}"]
+
+    for i in range(num_nodes):
+        alpha = np.full(cardinalities[i], concentration)
+
+        if not parents[i]:
+            lines += ["probability ( {} ) {{".format(names[i]),
+                      "  table {};".format(", ".join(repr(float(p)) for p in rng.dirichlet(alpha))),
+                      "}"]
+            continue
+
+        lines.append("probability ( {} | {} ) {{".format(
+            names[i], ", ".join(names[p] for p in parents[i])))
+
+        # the first parent's value changes fastest, as in network_files
+        for combination in itertools.product(*[values[p] for p in reversed(parents[i])]):
+            lines.append("  ({}) {};".format(
+                ", ".join(reversed(combination)),
+                ", ".join(repr(float(p)) for p in rng.dirichlet(alpha))))
+
+        lines.append("}")
+
+    return "\n".join(lines) + "\n"
+
+
+def random_network(num_nodes: int, cardinality=2, max_parents: int = 3, treewidth: int = None,
+                   seed: int = None, name: str = None, concentration: float = 1.0)->BayesNet:
+    """
+    Generates a random Bayesian network as a BayesNet; takes the
+        arguments of random_bif.
+    """
+    return BayesNet.from_string(random_bif(num_nodes, cardinality, max_parents, treewidth,
+                                           seed, name, concentration))
+
+
+def main(argv: list = None)->int:
+    parser = argparse.ArgumentParser(description="Generate a random Bayesian network "
+                                     "as a .bif file.")
+    parser.add_argument('num_nodes', type=int)
+    parser.add_argument('--cardinality', type=int, nargs='+', default=[2],
+                        help="number of values per variable, or a low and high bound")
+    parser.add_argument('--max-parents', type=int, default=3)
+    parser.add_argument('--treewidth', type=int, help="bound on the moral graph's treewidth")
+    parser.add_argument('--concentration', type=float, default=1.0,
+                        help="Dirichlet parameter of the CPT rows")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--name')
+    parser.add_argument('-o', '--output', help="file to write to; standard output by default")
+    args = parser.parse_args(argv)
+
+    if len(args.cardinality) > 2:
+        parser.error("--cardinality takes one or two numbers")
+
+    cardinality = args.cardinality[0] if len(args.cardinality) == 1 else args.cardinality
+    text = random_bif(args.num_nodes, cardinality, args.max_parents, args.treewidth,
+                      args.seed, args.name, args.concentration)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            file.write(text)
+    else:
+        sys.stdout.write(text)
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
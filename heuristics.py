@@ -10,6 +10,7 @@ Chose not to define a class for these so as to
     
 All orderings executed from 0th element to last element.
 """
+import heapq
 import numpy as np
 from copy import deepcopy
 from collections import Counter
@@ -155,7 +156,7 @@ def most_incoming_arcs_first(factors:FactorGroup, observed, query:str)->np.array
     for factor in factors.factors:
         
         if factor.name != query and factor.name not in observed:
-            counts[factor.name] = len(factor.cp_table.columns) - 1
+            counts[factor.name] = len(factor.scope)
         
     ordering = [k for k,v in sorted(counts.items(), key=lambda item:item[1],
                                    reverse=True)]
@@ -190,8 +191,222 @@ def least_incoming_arcs_first(factors:FactorGroup, observed, query:str)->np.arra
     for factor in factors.factors:
         
         if factor.name != query and factor.name not in observed:
-            counts[factor.name] = len(factor.cp_table.columns) - 1
+            counts[factor.name] = len(factor.scope)
         
     ordering = [k for k,v in sorted(counts.items(), key=lambda item:item[1])]
     
-    return ordering
\ No newline at end of file
+    return ordering
+
+def interaction_graph(factors:FactorGroup)->dict:
+    """
+    Builds the interaction graph of a factor group: every variable
+        involved in the group is a node, and two variables share an
+        edge if some factor contains both. For the network's CPTs 
+        this is the moral graph.
+        
+    param factors: pre-reduced network factors
+    
+    returns dict mapping each variable to the set of its neighbours,
+        with variables in order of first appearance
+    """
+    graph = {}
+    for factor in factors.factors:
+        for var in factor.scope:
+            graph.setdefault(var, set()).update(v for v in factor.scope if v != var)
+            
+    return graph
+
+
+def greedy_ordering(factors:FactorGroup, query:str, cost, reach:int = 1)->list:
+    """
+    Orders variables by repeatedly eliminating the variable with
+        the lowest cost from the interaction graph. Eliminating a
+        variable connects all of its neighbours, as multiplying the
+        factors which contain it does, so costs are re-scored
+        against the graph that remains after every elimination.
+        Ties go to the variable which appears first.
+        
+        Costs are kept in a heap, and after each elimination only
+        the variables within reach of the eliminated variable's
+        neighbours are re-scored, since no other cost can change.
+        
+    param factors: pre-reduced network factors
+    
+    param query: variable being queried, which is never eliminated
+    
+    param cost: function of (graph, variable, values) giving the
+        cost of eliminating variable from graph
+        
+    param reach: 1 if the cost of a variable only depends on its
+        own neighbours, 2 if it also depends on the edges between
+        them
+        
+    returns elimination ordering
+    """
+    graph = interaction_graph(factors)
+    position = {var: i for i, var in enumerate(graph) if var != query}
+    
+    # current cost per remaining variable; heap entries whose cost
+    # differs from it are outdated and skipped
+    scores = {var: cost(graph, var, factors.values) for var in position}
+    heap = [(score, position[var], var) for var, score in scores.items()]
+    heapq.heapify(heap)
+    ordering = []
+    
+    while heap:
+        score, _, var = heapq.heappop(heap)
+        
+        if scores.get(var) != score:
+            continue
+        
+        del scores[var]
+        
+        neighbours = graph.pop(var)
+        for n in neighbours:
+            graph[n].update(neighbours)
+            graph[n].discard(n)
+            graph[n].discard(var)
+            
+        changed = set(neighbours)
+        if reach > 1:
+            for n in neighbours:
+                changed.update(graph[n])
+                
+        for v in changed:
+            if v in scores:
+                new_score = cost(graph, v, factors.values)
+                if new_score != scores[v]:
+                    scores[v] = new_score
+                    heapq.heappush(heap, (new_score, position[v], v))
+            
+        ordering.append(var)
+        
+    return ordering
+
+
+def count_fill_edges(graph:dict, var:str)->int:
+    """
+    Returns the number of pairs of neighbours of var which are not
+        yet connected, i.e., of edges eliminating var would add.
+    """
+    neighbours = graph[var]
+    
+    # every missing edge is seen from both of its ends; a neighbour
+    # is not connected to itself either
+    missing = sum(len(neighbours - graph[a]) - 1 for a in neighbours)
+    
+    return missing // 2
+
+
+def fill_weight(graph:dict, var:str, values:dict)->int:
+    """
+    Returns the total weight of the edges eliminating var would add,
+        where an edge weighs the product of the number of values of
+        its two variables.
+    """
+    neighbours = graph[var]
+    total = 0
+    
+    for a in neighbours:
+        missing = neighbours - graph[a]
+        missing.discard(a)
+        total += len(values[a]) * sum(len(values[b]) for b in missing)
+        
+    return total // 2
+
+
+def min_degree(factors:FactorGroup, observed, query:str)->list:
+    """
+    Returns ordering which greedily eliminates the variable with
+        the fewest neighbours in the interaction graph.
+        
+    param factors: pre-reduced network factors, such that
+        observed evidence has been acted upon.
+
+        Rows containing contradictory observation values
+        and columns denoting observed variables should be 
+        removed.
+        
+    param observed: list of observed variable names (str)
+    
+    param query: variable being queried
+        
+    returns ordering such that the variable involved with the
+        fewest other variables is evaluated first at every step.
+    """
+    return greedy_ordering(factors, query, 
+                           lambda graph, var, values: len(graph[var]))
+
+
+def min_fill(factors:FactorGroup, observed, query:str)->list:
+    """
+    Returns ordering which greedily eliminates the variable whose
+        elimination adds the fewest edges to the interaction graph.
+        
+    param factors: pre-reduced network factors, such that
+        observed evidence has been acted upon.
+
+        Rows containing contradictory observation values
+        and columns denoting observed variables should be 
+        removed.
+        
+    param observed: list of observed variable names (str)
+    
+    param query: variable being queried
+        
+    returns ordering such that the variable connecting the fewest
+        unconnected variables is evaluated first at every step.
+    """
+    return greedy_ordering(factors, query, 
+                           lambda graph, var, values: count_fill_edges(graph, var), reach=2)
+
+
+def min_weight(factors:FactorGroup, observed, query:str)->list:
+    """
+    Returns ordering which greedily eliminates the variable whose
+        multiplication step produces the smallest factor, i.e.,
+        the product of the number of values of the variable and
+        of each of its neighbours.
+        
+    param factors: pre-reduced network factors, such that
+        observed evidence has been acted upon.
+
+        Rows containing contradictory observation values
+        and columns denoting observed variables should be 
+        removed.
+        
+    param observed: list of observed variable names (str)
+    
+    param query: variable being queried
+        
+    returns ordering such that the variable producing the smallest
+        product table is evaluated first at every step.
+    """
+    return greedy_ordering(factors, query, 
+                           lambda graph, var, values: np.prod(
+                               [len(values[v]) for v in graph[var] | {var}], dtype=float))
+
+
+def weighted_min_fill(factors:FactorGroup, observed, query:str)->list:
+    """
+    Returns ordering which greedily eliminates the variable whose
+        added edges have the lowest total weight, where an edge 
+        weighs the product of the number of values of its two
+        variables.
+        
+    param factors: pre-reduced network factors, such that
+        observed evidence has been acted upon.
+
+        Rows containing contradictory observation values
+        and columns denoting observed variables should be 
+        removed.
+        
+    param observed: list of observed variable names (str)
+    
+    param query: variable being queried
+        
+    returns ordering such that the variable adding the lightest
+        edges is evaluated first at every step.
+    """
+    return greedy_ordering(factors, query, 
+                           lambda graph, var, values: fill_weight(graph, var, values), reach=2)
@@ -0,0 +1,458 @@
+"""
+@Author: Harrison Froedge, Shenghang Wang
+
+Dry runs of variable elimination. Simulates elimination on the
+    scopes of factors only, without touching any probability
+    table, to predict the size of every intermediate factor and
+    the computation count CostTracker would report.
+"""
+from __future__ import annotations
+import numpy as np
+import pandas as pd
+from factors import Factor, FactorGroup
+from reports import CostTracker
+
+
+class SymbolicFactorGroup(FactorGroup):
+
+    def __init__(self, values: dict, *factors:SymbolicFactor, max_rows:int = None):
+        """
+        Defines a group of symbolic factors. Shares the interface
+            of FactorGroup, so the heuristics accept it, but only
+            keeps track of scopes.
+
+        param values: dict of possible values the variables
+            initially included in this FactorGroup can take on.
+            {'variable':[possible values]}
+
+        param factors: symbolic factors to include in the group
+
+        param max_rows: unused; symbolic factors allocate nothing
+        """
+        super().__init__(values, *factors, max_rows=max_rows)
+
+
+    @property
+    def factor_type(self)->type:
+        """
+        Type of factor this group holds
+        """
+        return SymbolicFactor
+
+
+    def multiply(self)->SymbolicFactor:
+        """
+        Returns a symbolic factor over the scope the product of
+            the group would have, in order of first appearance.
+        """
+        scope = list(dict.fromkeys(self.getAllVarNames(include_duplicates=True)))
+
+        return SymbolicFactor("", scope, self.values)
+
+
+class SymbolicFactor(Factor):
+
+    __slots__ = ()
+
+    def __init__(self, name: str, scope: list, values: dict):
+        """
+        Defines a factor by its scope alone.
+
+        param name: a name with which to reference the factor.
+        param scope: ordered list of the variables of the factor
+        param values: dict of possible values of (at least) the
+            variables in scope. {'variable':[possible values]}
+        """
+        self.name = name
+        self._scope = tuple(scope)
+        self.values = values
+        self.sources = frozenset()
+
+
+    @property
+    def scope(self)->tuple:
+        """
+        Variables the factor is defined over.
+        """
+        return self._scope
+
+
+    @property
+    def size(self)->int:
+        """
+        Number of rows the factor's table would have. As with
+            Factor, a factor with every variable summed out has none.
+        """
+        if not self._scope:
+            return 0
+
+        return int(np.prod([len(self.values[var]) for var in self._scope]))
+
+
+    def normalize(self)->SymbolicFactor:
+        """
+        Normalizing does not change the scope of a factor.
+        """
+        return self
+
+
+    def marginalize(self, *variables:str)->SymbolicFactor:
+        """
+        Removes variables from the factor's scope.
+
+        param variables: one or more variables in the factor
+            to be eliminated.
+        """
+        if not variables or any(var not in self._scope for var in variables):
+            raise ValueError("Something went wrong." +
+                             " Variable to be eliminated not found in factor")
+
+        self._scope = tuple(var for var in self._scope if var not in variables)
+
+        return self
+
+
+class EliminationPlan():
+
+    def __init__(self, query: str, observed: dict, elim_order: list, steps: list,
+                 computations: int):
+        """
+        The predicted course of a variable elimination run.
+
+        param query: the query variable
+        param observed: the observed variables
+        param elim_order: the elimination ordering followed
+        param steps: one dict per multiplication step (see plan_elimination)
+        param computations: the total computation count CostTracker
+            would report for the run
+        """
+        self.query = query
+        self.observed = observed
+        self.elim_order = elim_order
+        self.steps = pd.DataFrame(steps, columns=['variable', 'num_factors', 'product_scope',
+                                                 'product_rows', 'product_bytes',
+                                                 'result_scope', 'result_rows',
+                                                 'peak_rows'])
+        self.computations = computations
+
+        # the largest number of variables any factor is defined over,
+        # excluding the one being eliminated
+        self.induced_width = max([len(s) for s in self.steps['product_scope']], default=1) - 1
+        self.max_rows = int(self.steps['product_rows'].max()) if steps else 0
+        self.max_bytes = int(self.steps['product_bytes'].max()) if steps else 0
+
+        # the largest number of rows any step actually allocates, which
+        # is below max_rows when steps do not build their products
+        self.peak_rows = int(self.steps['peak_rows'].max()) if steps else 0
+
+
+    def __repr__(self)->str:
+        return ("EliminationPlan(query={}, induced_width={}, max_rows={}, "
+                "max_bytes={}, computations={})").format(self.query, self.induced_width,
+                                                         self.max_rows, self.max_bytes,
+                                                         self.computations)
+
+
+def get_initial_scopes(network, variables: list, observed: dict)->SymbolicFactorGroup:
+    """
+    Generates the symbolic counterpart of
+        VariableElimination.getInitialFactors: a factor over
+        each variable and its parents, with observed variables
+        removed, leaving out factors with nothing left.
+
+    param network: a BayesNet
+    param variables: variables of the network to create factors for
+    param observed: A dictionary of the observed variables {variable: value}
+
+    returns group of symbolic reduced factors
+    """
+    factors = SymbolicFactorGroup(network.values)
+
+    for var in variables:
+
+        scope = [v for v in [var] + network.parents[var] if v not in observed]
+
+        if scope:
+            factors.append(SymbolicFactor(var, scope, network.values))
+
+    return factors
+
+
+def get_ordering(network, factors: SymbolicFactorGroup, query: str, observed: dict,
+                 elim_order)->list:
+    """
+    Determines the elimination ordering to simulate on factors.
+
+    param network: a BayesNet
+    param factors: the reduced (and possibly pruned) symbolic factors
+    param query: the query variable
+    param observed: A dictionary of the observed variables {variable: value}
+    param elim_order: an elimination ordering (list of variables), or
+        a heuristic from heuristics.py to determine one. An ordering
+        may name any variables of the network: the query and those
+        in no factor, i.e., observed or pruned ones, are left out.
+
+    returns elimination ordering (list of variables)
+    """
+    if callable(elim_order):
+        return list(elim_order(factors, observed.keys(), query))
+
+    unknown = [X for X in elim_order if X not in network.values]
+    if unknown:
+        raise ValueError("Unknown variables {} in elimination ordering".format(unknown))
+
+    return [X for X in elim_order if X != query and factors.countInvolving(X)]
+
+
+def plan_elimination(network, query: str, observed: dict, elim_order, 
+                     prune: bool = True, fused: bool = False)->EliminationPlan:
+    """
+    Simulates VariableElimination.run on the scopes of the network's
+        factors and reports the size of every product and result.
+
+    param network: a BayesNet
+    param query: the query variable
+    param observed: A dictionary of the observed variables {variable: value}
+    param elim_order: an elimination ordering (list of variables), or
+        a heuristic from heuristics.py to determine one (see
+        get_ordering)
+    param prune: if True, only plans on the factors of
+        network.relevant_nodes, as VariableElimination does when
+        pruning
+    param fused: if True, plans for steps which sum the variable out
+        while multiplying without building the product (see
+        DenseFactorGroup.multiplyAndMarginalize), so that only
+        their results are allocated
+
+    returns EliminationPlan, whose steps have a row per multiplication:
+        the variable eliminated (None for the final multiplication),
+        the number of factors multiplied, the scope, rows and bytes
+        (as a dense float64 table) of their product, the scope
+        and rows of the factor left after marginalizing, and the
+        rows of the largest of those the step allocates.
+    """
+    variables = network.relevant_nodes(query, observed) if prune else network.nodes
+    factors = get_initial_scopes(network, variables, observed)
+
+    elim_order = get_ordering(network, factors, query, observed, elim_order)
+
+    cost_tracker = CostTracker()
+    itemsize = np.dtype(float).itemsize
+    steps = []
+
+    for X in elim_order:
+
+        Rs = factors.extractInvolving(X)
+        T = Rs.multiply()
+        product_scope, product_rows = list(T.scope), T.size
+
+        N = T.marginalize(X)
+
+        if N.scope:
+            N.name = X
+            factors.append(N)
+
+        cost_tracker.trackMerges(T, Rs)
+        cost_tracker.trackSums(N)
+
+        steps.append({'variable': X, 'num_factors': len(Rs),
+                      'product_scope': product_scope, 'product_rows': product_rows,
+                      'product_bytes': product_rows * itemsize,
+                      'result_scope': list(N.scope), 'result_rows': N.size,
+                      'peak_rows': N.size if fused else product_rows})
+
+    T = factors.multiply()
+
+    cost_tracker.trackMerges(T, factors)
+    cost_tracker.trackSums(T)
+
+    steps.append({'variable': None, 'num_factors': len(factors),
+                  'product_scope': list(T.scope), 'product_rows': T.size,
+                  'product_bytes': T.size * itemsize,
+                  'result_scope': list(T.scope), 'result_rows': T.size,
+                  'peak_rows': T.size})
+
+    return EliminationPlan(query, observed, elim_order, steps, cost_tracker.computations)
+
+
+def elimination_schedule(factors: FactorGroup, elim_order: list)->tuple:
+    """
+    Simulates VariableElimination.run on the scopes of factors and
+        records which factors every step multiplies, from which the
+        steps that do not depend on each other can be told apart.
+        Factors are numbered by slot: factors.factors take slots
+        0 to n - 1, and the result of each step that is kept takes
+        the next free slot.
+
+    param factors: reduced factors, left unchanged
+    param elim_order: an elimination ordering (list of variables)
+
+    returns steps, as a list of (variable, input slots, output slot or
+        None if the result is summed down to a constant), and the
+        slots of the factors multiplied after the last step.
+    """
+    scopes = SymbolicFactorGroup(factors.values)
+    for slot, factor in enumerate(factors.factors):
+        scopes.append(SymbolicFactor(slot, factor.scope, factors.values))
+
+    num_slots = len(factors)
+    steps = []
+
+    for X in elim_order:
+
+        Rs = scopes.extractInvolving(X)
+        N = Rs.multiply().marginalize(X)
+        output = None
+
+        if N.scope:
+            output = N.name = num_slots
+            num_slots += 1
+            scopes.append(N)
+
+        steps.append((X, [f.name for f in Rs.factors], output))
+
+    return steps, [f.name for f in scopes.factors]
+
+
+class QueryPlan():
+
+    def __init__(self, network, query: str, observed_vars, elim_order, 
+                 prune: bool = True):
+        """
+        A variable elimination run compiled for a query and a set of
+            observed variables, which can be executed for any values
+            of those variables. Compiling simulates the run on scopes
+            once; executing only indexes the CPTs on the evidence and
+            multiplies and sums arrays in a fixed sequence, without
+            evaluating a heuristic or searching factor scopes.
+
+        param network: a BayesNet
+        param query: the query variable
+        param observed_vars: the observed variables
+        param elim_order: an elimination ordering (list of variables), or
+            a heuristic from heuristics.py to determine one (see
+            get_ordering)
+        param prune: if True, only uses the factors of
+            network.relevant_nodes, as VariableElimination does when
+            pruning
+        """
+        observed = dict.fromkeys(observed_vars)
+        variables = network.relevant_nodes(query, observed) if prune else network.nodes
+        factors = get_initial_scopes(network, variables, observed)
+
+        elim_order = get_ordering(network, factors, query, observed, elim_order)
+
+        self.network = network
+        self.query = query
+        self.observed_vars = frozenset(observed)
+        self.elim_order = elim_order
+
+        # CPTs to index, as (variable, [(axis, observed variable), ...])
+        self.initial = []
+
+        # steps, as ([(slot, transpose order, shape), ...], axis to sum)
+        self.steps = []
+
+        # slot holding each factor during the simulation, by id; the
+        # factors are kept in held so that their ids stay unique
+        slots = {}
+        held = []
+
+        for factor in factors.factors:
+            family = [factor.name] + network.parents[factor.name]
+            self.initial.append((factor.name, [(axis, var) for axis, var in enumerate(family)
+                                               if var in observed]))
+            slots[id(factor)] = len(held)
+            held.append(factor)
+
+        cost_tracker = CostTracker()
+
+        for X in elim_order:
+
+            Rs = factors.extractInvolving(X)
+            T = Rs.multiply()
+            inputs = [(slots[id(f)],) + self.alignment(f.scope, T.scope) for f in Rs.factors]
+            axis = T.scope.index(X)
+
+            N = T.marginalize(X)
+
+            if N.scope:
+                N.name = X
+                factors.append(N)
+                slots[id(N)] = len(held)
+                held.append(N)
+
+            cost_tracker.trackMerges(T, Rs)
+            cost_tracker.trackSums(N)
+
+            # results summed down to a constant get no slot
+            self.steps.append((inputs, axis, bool(N.scope)))
+
+        T = factors.multiply()
+        self.final = [(slots[id(f)],) + self.alignment(f.scope, [query]) for f in factors.factors]
+
+        cost_tracker.trackMerges(T, factors)
+        cost_tracker.trackSums(T)
+
+        # computations a CostTracker counts for each run
+        self.computations = cost_tracker.computations
+
+
+    def alignment(self, scope: list, product_scope: list)->tuple:
+        """
+        Returns the transpose order and shape that align a table over
+            scope with a product over product_scope, as in
+            DenseFactor.expand.
+        """
+        order = sorted(range(len(scope)), key=lambda i: product_scope.index(scope[i]))
+        shape = [len(self.network.values[var]) if var in scope else 1 for var in product_scope]
+
+        return order, shape
+
+
+    def execute(self, observed: dict, cost_tracker: CostTracker = None)->pd.DataFrame:
+        """
+        Runs the plan on the given values of the observed variables.
+
+        param observed: A dictionary of the observed variables
+            {'variable': value}, with exactly the plan's observed variables
+        param cost_tracker: a CostTracker object to track computations.
+
+        returns the distribution of the query variable, in the format
+            VariableElimination.run returns
+        """
+        if set(observed) != self.observed_vars:
+            raise ValueError("Plan was compiled for observed variables " +
+                             "{}, not {}".format(sorted(self.observed_vars), sorted(observed)))
+
+        # raises ValueError for unknown values, as VariableElimination.run does
+        codes = {var: self.network.encode(var, value) for var, value in observed.items()}
+
+        slots = []
+        for var, axes in self.initial:
+            index = [slice(None)] * self.network.tables[var].ndim
+            for axis, observed_var in axes:
+                index[axis] = codes[observed_var]
+            slots.append(self.network.tables[var][tuple(index)])
+
+        for inputs, axis, kept in self.steps:
+            table = np.ones(())
+            for slot, order, shape in inputs:
+                table = table * slots[slot].transpose(order).reshape(shape)
+                # every factor is consumed exactly once
+                slots[slot] = None
+
+            if kept:
+                slots.append(table.sum(axis=axis))
+
+        table = np.ones(len(self.network.values[self.query]))
+        for slot, order, shape in self.final:
+            table = table * slots[slot].transpose(order).reshape(shape)
+
+        if cost_tracker:
+            cost_tracker.computations += self.computations
+
+        distribution = pd.DataFrame({self.query: self.network.values[self.query]})
+        distribution['prob'] = table / table.sum()
+
+        return distribution
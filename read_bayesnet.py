@@ -1,121 +1,477 @@
-"""
-@Author: Joris van Vugt, Moira Berens, Leonieke van den Bulk
-
-Representation of a Bayesian network read in from a .bif file.
-
-"""
-
-import pandas as pd
-
-class BayesNet():
-    """
-    This class represents a Bayesian network.
-    It can read files in a .bif format (if the formatting is
-    along the lines of http://www.bnlearn.com/bnrepository/)
-
-    Uses pandas DataFrames for representing conditional probability tables
-    """
-
-    # Possible values per variable
-    values = {}
-
-    # Probability distributions per variable
-    probabilities = {}
-
-    # Parents per variable
-    parents = {}
-
-    def __init__(self, filename):
-        """
-        Construct a bayesian network from a .bif file
-
-        """
-        with open(filename, 'r') as file:
-            line_number = 0
-            for line in file:
-                if line.startswith('network'):
-                    self.name = ' '.join(line.split()[1:-1])
-                elif line.startswith('variable'):
-                    self.parse_variable(line_number, filename)
-                elif line.startswith('probability'):
-                    self.parse_probability(line_number, filename)
-                line_number = line_number + 1
-
-    def parse_probability(self, line_number, filename):
-        """
-        Parse the probability distribution
-        """
-
-        # get line
-        line = open(filename, 'r').readlines()[line_number]
-
-        # Find out what variable(s) we are talking about
-        variable, parents = self.parse_parents(line)
-        next_line = open(filename, 'r').readlines()[line_number + 1].strip()
-
-        # If a variable has no parents, its probabilities start with table
-        if next_line.startswith('table'):
-            comma_sep_probs = next_line.split('table')[1].split(';')[0].strip()
-            probs = [float(p) for p in comma_sep_probs.split(',')]
-            df = pd.DataFrame(columns=[variable, 'prob'])
-            for value, p in zip(self.values[variable], probs):
-                df.loc[len(df)] = [value, p]
-                self.probabilities[variable] = df
-        else:
-            #create dataFrame to store the variables
-            df = pd.DataFrame(columns=[variable] + parents + ['prob'])
-
-            #loop over the lines until a line is the same as "}" 
-            with open(filename, 'r') as file:
-                for i in range(line_number + 1):
-                    file.readline()
-                for line in file:
-                    if '}' in line:
-                        # Done reading this probability distribution
-                        break
-                    
-                    # Get the values for the parents
-                    comma_sep_values = line.split('(')[1].split(')')[0]
-                    values = [v.strip() for v in comma_sep_values.split(',')]
-
-                    # Get the probabilities for the variable
-                    comma_sep_probs = line.split(')')[1].split(';')[0].strip()
-                    probs = [float(p) for p in comma_sep_probs.split(',')]
-
-                	# Create a row in the df for each value combination
-                    for value, p in zip(self.values[variable], probs):
-                        df.loc[len(df)] = [value] + values + [p]
-
-            self.probabilities[variable] = df
-
-    def parse_variable(self, line_number, filename):
-        """
-        Parse the name of a variable and its possible values
-        """
-        variable = open(filename, 'r').readlines()[line_number].split()[1]
-        line = open(filename, 'r').readlines()[line_number+1]
-        start = line.find('{') + 1
-        end = line.find('}')
-        values = [value.strip() for value in line[start:end].split(',')]
-        self.values[variable] = values
-
-    def parse_parents(self, line):
-        """
-        Find out what variables are the parents
-        Returns the variable and its parents
-        """
-        start = line.find('(') + 1
-        end = line.find(')')
-        variables = line[start:end].strip().split('|')
-        variable = variables[0].strip()
-        if len(variables) > 1:
-            parents = variables[1]
-            self.parents[variable] = [v.strip() for v in parents.split(',')]
-        else:
-            self.parents[variable] = []
-        return variable, self.parents[variable]
-
-    @property
-    def nodes(self):
-        """Returns the names of the variables in the network"""
-        return list(self.values.keys())
+"""
+@Author: Joris van Vugt, Moira Berens, Leonieke van den Bulk
+
+Representation of a Bayesian network read in from a .bif file.
+
+"""
+
+import io
+import re
+import json
+import struct
+import numpy as np
+import pandas as pd
+
+# comments, single character delimiters, and runs of anything else
+TOKENS = re.compile(r'//[^\n]*|/\*.*?\*/|[{}()\[\]|,;]|[^\s{}()\[\]|,;]+', re.S)
+
+# first bytes of a compiled network file, followed by the header length
+COMPILED_MAGIC = b'BNC1'
+
+
+def code_dtype(n):
+    """
+    Returns the smallest integer type holding the codes
+    of n values
+    """
+    return np.int8 if n <= np.iinfo(np.int8).max else np.int16
+
+
+class BayesNet():
+    """
+    This class represents a Bayesian network.
+    It can read files in a .bif format (if the formatting is
+    along the lines of http://www.bnlearn.com/bnrepository/)
+
+    Uses pandas DataFrames for representing conditional probability tables
+    """
+
+    def __init__(self, filename):
+        """
+        Construct a bayesian network from a .bif file
+
+        param filename: path to a .bif file, or an open file
+            object to read one from. Use BayesNet.from_string
+            to construct a network from .bif text.
+
+        """
+        # Name of the network, if declared
+        self.name = None
+
+        # Possible values per variable
+        self.values = {}
+
+        # Probability distributions per variable, built from
+        # self.tables on first access of self.probabilities
+        # and self.coded_probabilities
+        self._probabilities = None
+        self._coded_probabilities = None
+
+        # Code of each value per variable, built on first access
+        # of self.codes
+        self._codes = None
+
+        # Rows of the probability distributions per combination of
+        # values, built on first access of self.row_positions
+        self._row_positions = None
+
+        # Positions of the parent values of each row of the
+        # probability distribution per variable
+        self._rows = {}
+
+        # Parents per variable
+        self.parents = {}
+
+        # Probability distributions per variable as arrays with one
+        # axis per variable in [variable] + parents, indexed by the
+        # position of each value in self.values
+        self.tables = {}
+
+        if hasattr(filename, 'read'):
+            text = filename.read()
+        else:
+            with open(filename, 'r') as file:
+                text = file.read()
+
+        self.parse(text)
+
+    @classmethod
+    def from_string(cls, text):
+        """
+        Construct a bayesian network from the contents of a .bif file
+        """
+        return cls(io.StringIO(text))
+
+    def parse(self, text):
+        """
+        Tokenize the text of a .bif file and parse every block
+        in a single pass over the tokens
+        """
+        tokens = [t for t in TOKENS.findall(text) if not t.startswith('/')]
+        self.tokens = tokens
+        self.position = 0
+
+        while self.position < len(tokens):
+            keyword = self.next_token()
+            if keyword == 'network':
+                self.name = ' '.join(self.read_until('{'))
+                self.skip_block()
+            elif keyword == 'variable':
+                self.parse_variable()
+            elif keyword == 'probability':
+                self.parse_probability()
+
+        del self.tokens, self.position
+
+    def next_token(self):
+        """
+        Returns the next token and moves past it
+        """
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def read_until(self, *delimiters):
+        """
+        Returns the tokens up to the first of the given delimiters,
+        and moves past that delimiter
+        """
+        start = self.position
+        while self.tokens[self.position] not in delimiters:
+            self.position += 1
+        self.position += 1
+        return self.tokens[start:self.position - 1]
+
+    def read_list(self, end):
+        """
+        Returns the comma separated items up to the end token,
+        joining multi-token items with spaces
+        """
+        items = []
+        item = []
+        for token in self.read_until(end):
+            if token == ',':
+                items.append(' '.join(item))
+                item = []
+            else:
+                item.append(token)
+        if item:
+            items.append(' '.join(item))
+        return items
+
+    def skip_block(self):
+        """
+        Moves past the remainder of a block whose opening
+        brace has just been read
+        """
+        depth = 1
+        while depth:
+            token = self.next_token()
+            if token == '{':
+                depth += 1
+            elif token == '}':
+                depth -= 1
+
+    def parse_variable(self):
+        """
+        Parse the name of a variable and its possible values
+        """
+        variable = self.next_token()
+        self.read_until('{')
+
+        while True:
+            token = self.next_token()
+            if token == '}':
+                break
+            elif token == 'type':
+                # type discrete [ n ] { value, value, ... };
+                self.read_until('{')
+                self.values[variable] = self.read_list('}')
+                self.read_until(';')
+            else:
+                # properties and other statements
+                self.read_until(';')
+
+    def parse_probability(self):
+        """
+        Parse the probability distribution
+        """
+        self.read_until('(')
+        variable, parents = self.parse_parents(self.read_until(')'))
+        self.read_until('{')
+
+        table = np.zeros([len(self.values[v]) for v in [variable] + parents])
+        codes = {v: {value: i for i, value in enumerate(self.values[v])}
+                 for v in parents}
+
+        # positions of parent values in the order they are listed
+        rows = []
+
+        while True:
+            token = self.next_token()
+            if token == '}':
+                break
+            elif token == '(':
+                # (parent value, ...) p, p, ...;
+                values = self.read_list(')')
+                index = tuple(codes[p][v] for p, v in zip(parents, values))
+                table[(slice(None),) + index] = [float(p) for p in self.read_list(';')]
+                rows.append(index)
+            elif token == 'table':
+                # a variable without parents
+                table[:] = [float(p) for p in self.read_list(';')]
+                rows.append(())
+            else:
+                self.read_until(';')
+
+        self.tables[variable] = table
+        self._rows[variable] = np.array(rows, dtype=np.int16).reshape(len(rows), len(parents))
+
+    def row_codes(self, variable):
+        """
+        Returns the codes of the variable's value and of its parents'
+        values in every row of its probability distribution
+        """
+        rows = self._rows[variable]
+        n = len(self.values[variable])
+
+        # the variable's value changes fastest
+        var_codes = np.tile(np.arange(n), len(rows))
+        parent_codes = np.repeat(rows, n, axis=0)
+
+        return var_codes, parent_codes
+
+    def build_row_positions(self, variable):
+        """
+        Builds an array with an axis per variable in [variable] +
+        parents, like self.tables, holding the position of the row
+        with each combination of values in the variable's probability
+        distribution, or -1 for combinations it does not list
+        """
+        var_codes, parent_codes = self.row_codes(variable)
+
+        positions = np.full(self.tables[variable].shape, -1, dtype=np.int64)
+        positions[(var_codes,) + tuple(parent_codes.T)] = np.arange(len(var_codes))
+
+        return positions
+
+    def build_cp_table(self, variable, coded=False):
+        """
+        Builds the DataFrame for a probability distribution from its
+        table, with a row for each value of the variable for each
+        listed combination of parent values. If coded, the columns
+        of the variables hold the codes of their values (the
+        positions in self.values) rather than the values.
+        """
+        parents = self.parents[variable]
+        table = self.tables[variable]
+        var_codes, parent_codes = self.row_codes(variable)
+
+        def column(v, codes):
+            if coded:
+                return codes.astype(code_dtype(len(self.values[v])))
+            return self.decode(v, codes)
+
+        columns = {variable: column(variable, var_codes)}
+        for i, parent in enumerate(parents):
+            columns[parent] = column(parent, parent_codes[:, i])
+        columns['prob'] = table[(var_codes,) + tuple(parent_codes.T)]
+
+        return pd.DataFrame(columns)
+
+    def parse_parents(self, tokens):
+        """
+        Find out what variables are the parents
+        Returns the variable and its parents
+        """
+        variable = tokens[0]
+        self.parents[variable] = [t for t in tokens[2:] if t != ','] if '|' in tokens else []
+        return variable, self.parents[variable]
+
+    @property
+    def probabilities(self):
+        """
+        Returns the probability distribution per variable as DataFrames
+        with a column per variable and a 'prob' column
+        """
+        if self._probabilities is None:
+            self._probabilities = {v: self.build_cp_table(v) for v in self.tables}
+        return self._probabilities
+
+    @property
+    def coded_probabilities(self):
+        """
+        Returns the probability distribution per variable as DataFrames
+        like self.probabilities, with the codes of values (int8, or
+        int16 for variables with more than 127 values) in place of
+        the values
+        """
+        if self._coded_probabilities is None:
+            self._coded_probabilities = {v: self.build_cp_table(v, coded=True)
+                                         for v in self.tables}
+        return self._coded_probabilities
+
+    @property
+    def row_positions(self):
+        """
+        Returns the array of row positions per variable (see
+        build_row_positions). Indexing it with the codes of observed
+        values selects the rows of a probability distribution that
+        agree with the evidence without comparing any column.
+        """
+        if self._row_positions is None:
+            self._row_positions = {v: self.build_row_positions(v) for v in self.tables}
+        return self._row_positions
+
+    @property
+    def codes(self):
+        """
+        Returns the code of each value per variable, its position
+        in self.values: {'variable': {value: code}}
+        """
+        if self._codes is None:
+            self._codes = {v: {value: i for i, value in enumerate(values)}
+                           for v, values in self.values.items()}
+        return self._codes
+
+    def encode(self, variable, value):
+        """
+        Returns the code of a value of variable
+        """
+        try:
+            return self.codes[variable][value]
+        except KeyError:
+            raise ValueError("Unknown value {} for {}. ".format(value, variable) +
+                             "Expected one of {}".format(self.values[variable])) from None
+
+    def decode(self, variable, codes):
+        """
+        Returns an array of the values of variable with the given codes
+        """
+        return np.array(self.values[variable], dtype=object)[np.asarray(codes, dtype=np.intp)]
+
+    def compile(self, filename):
+        """
+        Writes the network to a compiled binary file, which
+        BayesNet.from_compiled can open without parsing.
+
+        The file holds COMPILED_MAGIC, the length of a JSON header
+        and the header, which lists the variables, their values and
+        parents (as indices into the variables) and the shape and
+        offset of each array. Then follow the tables of all variables
+        as float64 and the positions of the listed parent values as 
+        int16, both aligned to 8 bytes.
+        """
+        nodes = self.nodes
+        header = {'name': self.name, 'variables': nodes,
+                  'values': [self.values[v] for v in nodes],
+                  'parents': [[nodes.index(p) for p in self.parents[v]] for v in nodes],
+                  'tables': [], 'rows': []}
+
+        offset = 0
+        for v in nodes:
+            header['tables'].append([offset, list(self.tables[v].shape)])
+            offset += self.tables[v].size
+        header['float_count'] = offset
+
+        offset = 0
+        for v in nodes:
+            header['rows'].append([offset, list(self._rows[v].shape)])
+            offset += self._rows[v].size
+        header['int_count'] = offset
+
+        encoded = json.dumps(header).encode('utf-8')
+        encoded += b' ' * (-(len(COMPILED_MAGIC) + 8 + len(encoded)) % 8)
+
+        with open(filename, 'wb') as file:
+            file.write(COMPILED_MAGIC + struct.pack('<Q', len(encoded)) + encoded)
+            for v in nodes:
+                file.write(np.ascontiguousarray(self.tables[v], dtype='<f8').tobytes())
+            for v in nodes:
+                file.write(np.ascontiguousarray(self._rows[v], dtype='<i2').tobytes())
+
+    @classmethod
+    def from_compiled(cls, filename):
+        """
+        Opens a network written by BayesNet.compile. Its tables are
+        read-only views of a memory map of the file, so processes
+        opening the same file share its pages.
+        """
+        with open(filename, 'rb') as file:
+            if file.read(len(COMPILED_MAGIC)) != COMPILED_MAGIC:
+                raise ValueError("{} is not a compiled network file".format(filename))
+            length, = struct.unpack('<Q', file.read(8))
+            header = json.loads(file.read(length).decode('utf-8'))
+
+        float_offset = len(COMPILED_MAGIC) + 8 + length
+        int_offset = float_offset + 8 * header['float_count']
+        floats = np.memmap(filename, dtype='<f8', mode='r', offset=float_offset,
+                           shape=(header['float_count'],)) if header['float_count'] else np.empty(0)
+        ints = np.memmap(filename, dtype='<i2', mode='r', offset=int_offset,
+                         shape=(header['int_count'],)) if header['int_count'] else np.empty(0, dtype='<i2')
+
+        net = cls.__new__(cls)
+        net.name = header['name']
+        net.values = {}
+        net.parents = {}
+        net.tables = {}
+        net._rows = {}
+        net._probabilities = None
+        net._coded_probabilities = None
+        net._codes = None
+        net._row_positions = None
+
+        nodes = header['variables']
+        for i, v in enumerate(nodes):
+            net.values[v] = header['values'][i]
+            net.parents[v] = [nodes[p] for p in header['parents'][i]]
+
+            offset, shape = header['tables'][i]
+            net.tables[v] = floats[offset:offset + int(np.prod(shape))].reshape(shape)
+            offset, shape = header['rows'][i]
+            net._rows[v] = ints[offset:offset + int(np.prod(shape))].reshape(shape)
+
+        return net
+
+    def ancestors(self, variables):
+        """
+        Returns the given variables and all of their ancestors
+        """
+        found = set()
+        stack = list(variables)
+        while stack:
+            variable = stack.pop()
+            if variable not in found:
+                found.add(variable)
+                stack.extend(self.parents[variable])
+        return found
+
+    def relevant_nodes(self, query, observed):
+        """
+        Returns the nodes whose distributions can affect the
+        distribution of query given the observed variables, in
+        network order.
+
+        Nodes that are not ancestors of query or of an observed
+        variable are barren: they sum out to one. Of the remaining
+        distributions, reduced by the evidence, only those connected
+        to query through unobserved variables matter; the others
+        are d-separated from query by the evidence and only scale
+        the result.
+        """
+        ancestral = self.ancestors([query] + list(observed))
+        families = {v: [p for p in [v] + self.parents[v] if p not in observed]
+                    for v in ancestral}
+
+        # unobserved variables connected to query in the moral graph
+        # of the ancestral nodes once the observed ones are removed
+        neighbours = {}
+        for family in families.values():
+            for v in family:
+                neighbours.setdefault(v, set()).update(family)
+
+        connected = {query}
+        stack = [query]
+        while stack:
+            for v in neighbours.get(stack.pop(), ()):
+                if v not in connected:
+                    connected.add(v)
+                    stack.append(v)
+
+        return [v for v in self.nodes
+                if v in ancestral and connected.intersection(families[v])]
+
+    @property
+    def nodes(self):
+        """Returns the names of the variables in the network"""
+        return list(self.values.keys())
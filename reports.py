@@ -3,7 +3,9 @@
 """
 from factors import Factor, FactorGroup
 from datetime import datetime
+import logging
 import time
+import numpy as np
 
 class CostTracker():
     
@@ -26,7 +28,7 @@ class CostTracker():
         
         Returns None
         """
-        rows_summed = result.cp_table.shape[0]
+        rows_summed = result.size
 
         self.computations += rows_summed
         
@@ -47,8 +49,8 @@ class CostTracker():
         
         Returns None
         """
-        num_factors = len(factors.factors)
-        size_of_product = product.cp_table.shape[0]
+        num_factors = len(factors)
+        size_of_product = product.size
         
         self.computations += num_factors*size_of_product
         
@@ -58,88 +60,180 @@ class CostTracker():
     
 class LogWriter():
     
-    def __init__(self):
+    def __init__(self, level:int = None, sink = None, max_factor_rows:int = 20,
+                 labels:dict = None):
+        """
+        Streams a report of a computation to a sink. Messages are
+            only formatted when their level is enabled, so a writer
+            with level None does no formatting at all.
+            
+        param level: lowest level (from the logging module) to report.
+            Messages are reported at logging.INFO and factor tables at
+            logging.DEBUG. None reports nothing.
+        param sink: where to report to: an open file (or anything with
+            a write method), a logging.Logger, a path to a file to
+            create, or None to report nothing.
+        param max_factor_rows: factors with more rows are summarized
+            as their scope, their number of rows and their first rows.
+        param labels: if given, the values of the variables of factors
+            whose tables hold codes (see BayesNet.codes), e.g.,
+            BayesNet.values; such factors are reported with values.
+        """
         self.start = time.time()
+        self.level = level if sink is not None else None
+        self.sink = sink
+        self.max_factor_rows = max_factor_rows
+        self.labels = labels
+        
+        # file opened by the writer itself, closed by write()
+        self.file = None
         
-        computation_start = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        self.string = "Computation started at: {}\n".format(computation_start)
+        if isinstance(sink, str) and self.level is not None:
+            self.file = open(sink, "w")
+            self.sink = self.file
+        
+        self.print_message("Computation started at: {}", 
+                           datetime.now().strftime("%d/%m/%Y %H:%M:%S"))
+    
+    
+    def __enter__(self):
+        return self
+    
+    
+    def __exit__(self, *exc_info)->None:
+        self.write()
+        
+        return None
+    
+    
+    def enabled(self, level:int)->bool:
+        """
+        Returns whether messages of the given level are reported
+        """
+        return self.level is not None and level >= self.level
+    
+    
+    def emit(self, text:str, level:int)->None:
+        """
+        Passes formatted text on to the sink
+        """
+        if isinstance(self.sink, logging.Logger):
+            self.sink.log(level, text)
+        else:
+            self.sink.write("\n{}\n\n".format(text))
+            
+        return None
     
     
     def print_elapsed_time(self):
-        curr_time = datetime.now().strftime("%d/%m/%Y %H:%M:%S")
-        self.print_message("Computation ends at {}. {} seconds elapsed since log start.".format(curr_time, time.time() - self.start))
+        self.print_message("Computation ends at {}. {} seconds elapsed since log start.", 
+                           datetime.now().strftime("%d/%m/%Y %H:%M:%S"),
+                           time.time() - self.start)
     
     
-    def end_message(self, delimiter:str="")->None:
+    def end_message(self, delimiter:str="", level:int = logging.INFO)->None:
         """
-        Updates self.string with given delimiter pattern.
+        Reports given delimiter pattern.
         
-            Recommended options are '=' and '-'. Prints newline
-            if none given
+            Recommended options are '=' and '-'.
             
         param delimiter: delimiter to write to file to indicate end
             of a given message. Passed delimiter will be repeated n
             times, e.g., '-' produces '----------------------' etc.
         """
-        if delimiter:
-            border = delimiter*40
-            self.string += "\n{}\n".format(border)
-        else:
-            self.string += "\n"
+        if delimiter and self.enabled(level):
+            self.emit(delimiter*40, level)
         
         return None
     
     
-    def print_message(self, message:str)->None:
+    def print_message(self, message:str, *args, level:int = logging.INFO)->None:
         """
-        Updates self.string with given message
+        Reports given message, if level is enabled
         
-        param message: string to add to file
+        param message: string to add to report, formatted with args
+            if any are given
+        param args: values to format message with, which are only
+            converted to strings if level is enabled.
         
         returns None
         """
-        self.string += "\n{}\n".format(message)
-        self.end_message("")
+        if not self.enabled(level):
+            return None
+        
+        if args:
+            message = message.format(*args)
+            
+        self.emit(message, level)
         
         return None
     
     
-    def print_factor(self, factor)->None:
+    def print_factor(self, factor, level:int = logging.DEBUG)->None:
         """
-        Formats factor to pretty print and then passes 
-        the result to self.print_message to add to file.
+        Formats factor to pretty print and reports the result, if
+            level is enabled. Factors with more than max_factor_rows
+            rows are summarized.
             
         param factor: factor to add to log
         
         returns None
         """
-        self.print_message("{}".format(factor.cp_table))
+        if not self.enabled(level):
+            return None
+        
+        if factor.size > self.max_factor_rows:
+            self.emit("Factor over {} with {} rows, first {}:\n{}".format(
+                factor.scope, factor.size, self.max_factor_rows, 
+                self.decode(factor.head(self.max_factor_rows), factor.scope)), level)
+        else:
+            self.emit("{}".format(self.decode(factor.cp_table, factor.scope)), level)
         
         return None
+    
+    
+    def decode(self, cp_table, scope)->object:
+        """
+        Returns a copy of cp_table with the codes of the variables in
+            scope replaced by their labels, or cp_table itself if the
+            writer has no labels.
+        """
+        if self.labels is None:
+            return cp_table
+        
+        cp_table = cp_table.copy()
+        for var in scope:
+            cp_table[var] = np.array(self.labels[var], dtype=object)[cp_table[var].to_numpy(dtype=np.intp)]
+            
+        return cp_table
         
     
-    def print_factorGroup(self, factors:FactorGroup)->None:
+    def print_factorGroup(self, factors:FactorGroup, level:int = logging.DEBUG)->None:
         """
-        Formats factors to pretty print andd then passes the 
-            result to self.print_message to add to file.
+        Formats factors to pretty print and reports the results,
+            if level is enabled.
             
         param factors: a factor group
         
         returns None
         """
+        if not self.enabled(level):
+            return None
+        
         for factor in factors.factors:
-            self.print_factor(factor)
+            self.print_factor(factor, level)
             
         return None
         
         
     def write(self)->None:
         """
-        Writes contents of self.string to file
+        Flushes the sink, and closes it if the writer opened it.
         """
-        file_name = "log{}.txt".format(time.time())
-        
-        with open(file_name, "w") as file:
-            file.write(self.string)
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        elif self.level is not None and hasattr(self.sink, "flush"):
+            self.sink.flush()
             
-        return None
\ No newline at end of file
+        return None
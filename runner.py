@@ -0,0 +1,268 @@
+"""
+@Author: Harrison Froedge, Shenghang Wang
+
+Runs batches of queries on one network over a pool of processes.
+    Every process loads the network once, when it starts, so jobs
+    only carry their query, evidence and heuristic.
+"""
+import os
+import signal
+import tempfile
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import heuristics
+from read_bayesnet import BayesNet, COMPILED_MAGIC
+from reports import CostTracker
+from variable_elim import VariableElimination
+
+# the VariableElimination object of a worker process
+_engine = None
+
+
+class JobResult():
+
+    def __init__(self, index: int, query: str, evidence: dict, heuristic: str):
+        """
+        The outcome of one job of a QueryRunner.
+
+        param index: position of the job in the submitted jobs
+        param query: the query variable
+        param evidence: the observed variables {'variable': value}
+        param heuristic: name of the heuristic
+        """
+        self.index = index
+        self.query = query
+        self.evidence = evidence
+        self.heuristic = heuristic
+
+        # distribution as VariableElimination.run returns it, or None
+        # if the job failed, in which case error describes why
+        self.distribution = None
+        self.error = None
+        self.timed_out = False
+
+        self.computations = 0
+        self.elapsed = 0.0
+
+
+    @property
+    def ok(self)->bool:
+        return self.error is None
+
+
+    def __repr__(self)->str:
+        status = "ok" if self.ok else "failed: {}".format(self.error)
+        return "JobResult(index={}, query={}, heuristic={}, {})".format(
+            self.index, self.query, self.heuristic, status)
+
+
+def load_network(source)->BayesNet:
+    """
+    Opens a network from a path to a .bif file or to a file
+        written by BayesNet.compile.
+    """
+    with open(source, 'rb') as file:
+        compiled = file.read(len(COMPILED_MAGIC)) == COMPILED_MAGIC
+
+    return BayesNet.from_compiled(source) if compiled else BayesNet(source)
+
+
+def _init_worker(source, options: dict)->None:
+    """
+    Loads the network once per worker process
+    """
+    global _engine
+    _engine = VariableElimination(load_network(source), **options)
+
+    return None
+
+
+def _on_timeout(signum, frame):
+    raise TimeoutError("Job exceeded its time limit")
+
+
+def _run_job(index: int, query: str, evidence: dict, heuristic,
+             timeout: float)->JobResult:
+    """
+    Runs one job on the worker's network, reporting failures
+        in the result rather than raising them.
+    """
+    name = heuristic if isinstance(heuristic, str) else getattr(heuristic, '__name__', str(heuristic))
+    result = JobResult(index, query, evidence, name)
+    cost_tracker = CostTracker()
+    start = time.perf_counter()
+
+    # workers run one job at a time in their main thread, so an
+    # interval timer can interrupt a job that takes too long
+    alarm = timeout is not None and hasattr(signal, 'SIGALRM')
+    if alarm:
+        signal.signal(signal.SIGALRM, _on_timeout)
+        signal.setitimer(signal.ITIMER_REAL, timeout)
+
+    try:
+        if isinstance(heuristic, str):
+            heuristic = getattr(heuristics, heuristic)
+        result.distribution = _engine.run(query, evidence, heuristic, verbose=False,
+                                          cost_tracker=cost_tracker)
+    except Exception as error:
+        # exceptions are reported as text, since not all of them
+        # survive being sent back to the parent process
+        result.error = ''.join(traceback.format_exception_only(type(error), error)).strip()
+        result.timed_out = isinstance(error, TimeoutError)
+    finally:
+        if alarm:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+
+    result.computations = cost_tracker.computations
+    result.elapsed = time.perf_counter() - start
+
+    return result
+
+
+class QueryRunner():
+
+    def __init__(self, network, max_workers: int = None, timeout: float = None,
+                 max_pending: int = None, **options):
+        """
+        A pool of processes running variable elimination jobs on
+            one network.
+
+        param network: a BayesNet, or a path to a .bif file or to a
+            file written by BayesNet.compile. A BayesNet is compiled
+            to a temporary file, which the workers memory-map, so the
+            tables are neither pickled per job nor copied per worker.
+        param max_workers: number of processes; one per core by default
+        param timeout: if given, seconds after which a job is
+            interrupted and reported as timed out. Only enforced
+            where signal.SIGALRM exists.
+        param max_pending: largest number of jobs submitted but not yet
+            yielded, which bounds memory for long job iterables;
+            four per worker by default.
+        param options: keyword arguments for the VariableElimination
+            object of every worker, e.g., backend='dense'.
+        """
+        self.temporary = None
+
+        if isinstance(network, BayesNet):
+            handle, self.temporary = tempfile.mkstemp(suffix='.bnc')
+            os.close(handle)
+            network.compile(self.temporary)
+            source = self.temporary
+        else:
+            source = os.fspath(network)
+
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.timeout = timeout
+        self.max_pending = max_pending or 4 * self.max_workers
+        self.executor = ProcessPoolExecutor(self.max_workers, initializer=_init_worker,
+                                            initargs=(source, options))
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+    def close(self)->None:
+        """
+        Shuts the workers down and removes the temporary network file.
+        """
+        self.executor.shutdown(cancel_futures=True)
+
+        if self.temporary is not None:
+            os.remove(self.temporary)
+            self.temporary = None
+
+        return None
+
+
+    def submit(self, index: int, job):
+        """
+        Submits a job (query, evidence, heuristic), where heuristic is
+            a function from heuristics.py or its name.
+        """
+        query, evidence, heuristic = job
+
+        try:
+            return self.executor.submit(_run_job, index, query, dict(evidence), heuristic,
+                                        self.timeout)
+        except BrokenProcessPool as error:
+            # reported by collect, like jobs lost when the pool broke
+            future = Future()
+            future.set_exception(error)
+            return future
+
+
+    def collect(self, index: int, job, future)->JobResult:
+        """
+        Returns the result of a finished job, turning a failure outside
+            of _run_job, such as a failure of the pool itself (e.g., a
+            worker killed for running out of memory) or a job which
+            cannot be sent to a worker (e.g., a heuristic which cannot
+            be pickled), into a failed JobResult.
+        """
+        try:
+            return future.result()
+        except Exception as error:
+            query, evidence, heuristic = job
+            name = heuristic if isinstance(heuristic, str) else getattr(heuristic, '__name__', str(heuristic))
+            result = JobResult(index, query, evidence, name)
+            result.error = ''.join(traceback.format_exception_only(type(error), error)).strip()
+            return result
+
+
+    def run(self, jobs, ordered: bool = True):
+        """
+        Runs jobs on the workers and yields their results as they
+            become available.
+
+        param jobs: iterable of (query, evidence, heuristic) tuples, where
+            evidence is a dict {'variable': value} and heuristic is a
+            function from heuristics.py or its name. Consumed lazily.
+        param ordered: if True, results are yielded in the order of jobs;
+            otherwise in order of completion.
+
+        yields a JobResult per job. Failed and timed out jobs are
+            reported in their result instead of raising.
+        """
+        jobs = enumerate(jobs)
+        pending = deque() if ordered else {}
+
+        def fill():
+            while len(pending) < self.max_pending:
+                item = next(jobs, None)
+                if item is None:
+                    break
+                future = self.submit(*item)
+                if ordered:
+                    pending.append((item, future))
+                else:
+                    pending[future] = item
+
+        fill()
+
+        while pending:
+            if ordered:
+                (index, job), future = pending.popleft()
+                finished = [(index, job, future)]
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finished = [pending.pop(future) + (future,) for future in done]
+
+            for index, job, future in finished:
+                yield self.collect(index, job, future)
+
+            fill()
+
+
+    def run_all(self, jobs)->list:
+        """
+        Runs jobs and returns their JobResults in the order of jobs.
+        """
+        return list(self.run(jobs))
@@ -0,0 +1,110 @@
+"""
+@Author: Harrison Froedge, Shenghang Wang
+
+Stateful inference for interactive use, where evidence changes
+    one observation at a time. Keeps a clique tree over the whole
+    network with its messages, and only recomputes the messages
+    an observation affects.
+"""
+import numpy as np
+import pandas as pd
+from factors import DenseFactor, DenseFactorGroup
+from clique_tree import CliqueTree
+
+
+class InferenceSession():
+
+    def __init__(self, network, elim_heuristic, observed: dict = None, dense_cpts: dict = None):
+        """
+        Builds a clique tree over every variable of the network from
+            the unreduced factors, so that its structure does not
+            depend on the evidence. Evidence enters the tree as
+            indicator factors instead of by reducing factors.
+
+        param network: a BayesNet
+        param elim_heuristic: A heuristic function as accepted by
+            VariableElimination.run. It is passed no observed
+            variables and None as the query, and its ordering is
+            used to build the clique tree.
+        param observed: initial evidence {'variable': value}, if any
+        param dense_cpts: the network's CPTs as DenseFactors by variable,
+            e.g., VariableElimination.dense_cpts; wrapped anew if
+            not given
+        """
+        if dense_cpts is None:
+            dense_cpts = {var: DenseFactor(var, [var] + network.parents[var], table,
+                                           network.values)
+                          for var, table in network.tables.items()}
+
+        factors = DenseFactorGroup(network.values, *[dense_cpts[var] for var in network.nodes])
+
+        self.network = network
+        self.tree = CliqueTree(factors, elim_heuristic(factors, [], None))
+        self.observed = {}
+
+        for var, value in (observed or {}).items():
+            self.observe(var, value)
+
+
+    def observe(self, variable: str, value: str)->None:
+        """
+        Adds an observation, or changes the observed value of
+            variable.
+        """
+        values = self.network.values[variable]
+
+        if value not in values:
+            raise ValueError("Unknown value {} for {}. ".format(value, variable) +
+                             "Expected one of {}".format(values))
+
+        if self.observed.get(variable) == value:
+            return None
+
+        indicator = (np.array(values, dtype=object) == value).astype(float)
+
+        self.tree.setEvidence(variable, DenseFactor("", [variable], indicator,
+                                                    self.network.values))
+        self.observed[variable] = value
+
+        return None
+
+
+    def retract(self, variable: str)->None:
+        """
+        Removes the observation of variable, if there is one.
+        """
+        if self.observed.pop(variable, None) is not None:
+            self.tree.setEvidence(variable, None)
+
+        return None
+
+
+    def update(self, observed: dict)->None:
+        """
+        Changes the evidence to observed, only observing and retracting
+            the variables whose observations differ.
+        """
+        for var in [var for var in self.observed if var not in observed]:
+            self.retract(var)
+
+        for var, value in observed.items():
+            self.observe(var, value)
+
+        return None
+
+
+    def query(self, variable: str)->pd.DataFrame:
+        """
+        Returns the distribution of variable given the current
+            evidence, in the format VariableElimination.run returns.
+            Only the messages to the clique of variable which the
+            evidence changed since they were last needed are computed.
+            An observed variable has all probability on its observed
+            value.
+        """
+        if variable in self.observed:
+            distribution = pd.DataFrame({variable: self.network.values[variable]})
+            distribution['prob'] = (distribution[variable] == self.observed[variable]).astype(float)
+            return distribution
+
+        return self.tree.marginal(variable).cp_table
@@ -5,30 +5,289 @@
 Class for the implementation of the variable elimination algorithm.
 
 """
+import time
 import pandas as pd
 import itertools
 import numpy as np
-from copy import deepcopy
-from factors import Factor, FactorGroup
+from copy import copy, deepcopy
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import heuristics
+from factors import Factor, FactorGroup, DenseFactor, DenseFactorGroup, FactorBudgetError
 from reports import LogWriter, CostTracker
+from planner import EliminationPlan, QueryPlan, plan_elimination, get_initial_scopes, elimination_schedule
+from caching import LRUCache, MessageCache, ResultCache
+from clique_tree import CliqueTree
+from session import InferenceSession
 
 class VariableElimination():
+    
+    # heuristics tried, in order, when an ordering exceeds the row
+    # budget and budget_policy is 'reorder'
+    fallback_heuristics = [heuristics.min_fill, heuristics.weighted_min_fill,
+                           heuristics.min_weight, heuristics.min_degree]
 
-    def __init__(self, network):
+    def __init__(self, network, backend:str = 'pandas', max_rows:int = None, 
+                 budget_policy:str = 'raise', prune:bool = True, plan_cache_size:int = 64,
+                 message_cache_bytes:int = None, result_cache:ResultCache = None,
+                 multiplication:str = 'pairwise'):
         """
         Initialize the variable elimination algorithm with the specified network.
         Add more initializations if necessary.
+        
+        param backend: representation of factors during elimination.
+            'pandas' keeps every factor as a long format DataFrame,
+            holding the codes of values (see BayesNet.codes) rather
+            than the values until the result is decoded.
+            'dense' keeps every factor as an N-dimensional numpy array
+            with one axis per variable, which is much faster; run
+            still returns a DataFrame.
+        param max_rows: if given, the largest number of rows any
+            intermediate factor may have. run plans the elimination
+            before executing it and never allocates a larger factor.
+            With multiplication 'fused' and the 'dense' backend, the
+            products of elimination steps are never allocated, so only
+            their results count against max_rows.
+        param budget_policy: what run does when the ordering of the
+            given heuristic exceeds max_rows. 'raise' raises 
+            FactorBudgetError before any factor is multiplied.
+            'reorder' switches to the ordering of fallback_heuristics
+            with the smallest largest factor, and raises 
+            FactorBudgetError only if that ordering exceeds max_rows too.
+        param prune: if True, run only creates factors for the variables
+            which can affect the query given the evidence (see
+            BayesNet.relevant_nodes), leaving out barren variables and
+            those d-separated from the query by the evidence.
+        param plan_cache_size: number of compiled query plans run_compiled
+            keeps, evicting the least recently used.
+        param message_cache_bytes: if given, run caches the factors it
+            produces by marginalizing, up to this many bytes, and reuses
+            them in later runs which multiply the same network factors
+            under the same evidence, instead of recomputing them.
+        param result_cache: if given, run returns copies of the
+            distributions cached there for repeated queries and evidence,
+            without computing or logging anything, and caches the
+            distributions it computes. Call result_cache.invalidate(network)
+            after changing the network.
+        param multiplication: how the factors of each step are multiplied.
+            'pairwise' multiplies two factors at a time, smallest product
+            first (see FactorGroup.multiplyPairwise). 'joint' multiplies
+            all of them at once into the product's table. 'fused' sums
+            the eliminated variable out while multiplying, so that with
+            the 'dense' backend the product of a step is never built
+            (see DenseFactorGroup.multiplyAndMarginalize); it is then not
+            logged either. CostTracker counts the same computations 
+            in every case.
 
         """
+        if backend not in ('pandas', 'dense'):
+            raise ValueError("Unknown backend {}. ".format(backend) +
+                             "Expected 'pandas' or 'dense'")
+            
+        if budget_policy not in ('raise', 'reorder'):
+            raise ValueError("Unknown budget_policy {}. ".format(budget_policy) +
+                             "Expected 'raise' or 'reorder'")
+            
+        if multiplication not in ('pairwise', 'joint', 'fused'):
+            raise ValueError("Unknown multiplication {}. ".format(multiplication) +
+                             "Expected 'pairwise', 'joint' or 'fused'")
+            
         self.network = network
+        self.backend = backend
+        self.max_rows = max_rows
+        self.budget_policy = budget_policy
+        self.prune = prune
+        self.plan_cache = LRUCache(plan_cache_size)
+        self.message_cache = None if message_cache_bytes is None else MessageCache(message_cache_bytes)
+        self.result_cache = result_cache
+        self.multiplication = multiplication
+        
+        # values of the 'pandas' backend's factors: the codes of the
+        # network's values
+        self.coded_values = {var: list(range(len(values))) 
+                             for var, values in network.values.items()}
+        
+        # CPTs wrapped once per network, reduced on each query
+        self.dense_cpts = {var: DenseFactor(var, [var] + network.parents[var], 
+                                            table, network.values)
+                           for var, table in network.tables.items()}
         
 
-    def run(self, query: str, observed: dict, elim_heuristic, verbose:bool = True, cost_tracker:CostTracker = None)->pd.DataFrame:
+    def plan(self, query: str, observed: dict, elim_heuristic, 
+             fused:bool = None)->EliminationPlan:
+        """
+        Predicts the course of run without executing it, by simulating
+        elimination on the scopes of the factors only.
+        
+        Input:
+            query:      The query variable
+            observed:   A dictionary of the observed variables {'variable': value}
+            elim_heuristic: A heuristic function as accepted by run, or
+                        an elimination ordering (list of variables).
+            fused:      whether elimination steps skip building their
+                        products; by default, whether run's do, i.e., with
+                        multiplication 'fused' and the 'dense' backend.
+                        
+        Output: an EliminationPlan reporting the induced width, the largest
+                intermediate factor, the size of every step and the
+                computations a CostTracker would count during run.
+        """
+        if fused is None:
+            fused = self.multiplication == 'fused' and self.backend == 'dense'
+            
+        return plan_elimination(self.network, query, observed, elim_heuristic, self.prune, fused)
+    
+    
+    def getBudgetedOrdering(self, query: str, observed: dict, elim_heuristic, 
+                            fused:bool = None, batch_size:int = 1)->list:
+        """
+        Determines an elimination ordering whose largest intermediate
+        factor fits within self.max_rows, following self.budget_policy.
+        
+        param query: the query variable
+        param observed: A dictionary of the observed variables {variable: value}
+        param elim_heuristic: heuristic function as accepted by run
+        param fused: as for plan
+        param batch_size: number of evidence rows every factor may be
+            carried for at once, as in run_batch; the planned sizes
+            are multiplied by it
+        
+        returns elimination ordering (list of variables)
+        
+        raises FactorBudgetError if no acceptable ordering was found
+        """
+        plan = self.plan(query, observed, elim_heuristic, fused)
+        
+        if plan.peak_rows * batch_size > self.max_rows and self.budget_policy == 'reorder':
+            for heuristic in self.fallback_heuristics:
+                candidate = self.plan(query, observed, heuristic, fused)
+                if candidate.peak_rows < plan.peak_rows:
+                    plan = candidate
+        
+        if plan.peak_rows * batch_size > self.max_rows:
+            largest = plan.steps.loc[plan.steps['peak_rows'].idxmax()]
+            scope = (largest['product_scope'] if largest['peak_rows'] == largest['product_rows'] 
+                     else largest['result_scope'])
+            raise FactorBudgetError(int(largest['peak_rows']) * batch_size, self.max_rows, scope)
+            
+        return plan.elim_order
+    
+    
+    def compile(self, query: str, observed_vars, elim_heuristic)->QueryPlan:
+        """
+        Compiles a run for a query and a set of observed variables into a
+        QueryPlan, which can then be executed for any observed values.
+        Plans are cached in self.plan_cache, keyed by the query, the
+        observed variables and the heuristic.
+        
+        Input:
+            query:      The query variable
+            observed_vars: The observed variables (any iterable of names)
+            elim_heuristic: A heuristic function as accepted by run, or
+                        an elimination ordering (list of variables).
+            
+        Output: a QueryPlan
+        """
+        # orderings given as lists are keyed by their variables
+        heuristic_key = elim_heuristic if callable(elim_heuristic) else tuple(elim_heuristic)
+        key = (query, frozenset(observed_vars), heuristic_key)
+        plan = self.plan_cache.get(key)
+        
+        if plan is None:
+            if self.max_rows is None:
+                elim_order = elim_heuristic
+            else:
+                # executing a QueryPlan builds every product
+                elim_order = self.getBudgetedOrdering(query, dict.fromkeys(observed_vars), 
+                                                      elim_heuristic, fused=False)
+                
+            plan = QueryPlan(self.network, query, observed_vars, elim_order, self.prune)
+            self.plan_cache.put(key, plan)
+            
+        return plan
+    
+    
+    def run_compiled(self, query: str, observed: dict, elim_heuristic, 
+                     cost_tracker:CostTracker = None)->pd.DataFrame:
+        """
+        Finds the probability distribution of the query variable given the
+        observed variables like run, by executing the (cached) compiled plan
+        for the query and the observed variables. Does not write a log.
+        
+        Input:
+            query:      The query variable
+            observed:   A dictionary of the observed variables {'variable': value}
+            elim_heuristic: A heuristic function as accepted by run, or
+                        an elimination ordering (list of variables).
+            cost_tracker: a CostTracker object to track computations.
+            
+        Output: the distribution of the query variable, as run returns it.
+        """
+        plan = self.compile(query, observed.keys(), elim_heuristic)
+        
+        return plan.execute(observed, cost_tracker)
+    
+    
+    def multiply(self, factors: FactorGroup)->Factor:
+        """
+        Multiplies a group of factors as self.multiplication specifies
+        
+        param factors: factors to multiply
+        
+        returns a new factor: the product of factors
+        """
+        if self.multiplication == 'joint':
+            return factors.multiply()
+        
+        return factors.multiplyPairwise()
+    
+    
+    def eliminate(self, Rs: FactorGroup, X: str)->Factor:
+        """
+        Multiplies a group of factors and sums X out of the product,
+        as self.multiplication specifies
+        
+        param Rs: factors involving X
+        param X: variable to eliminate
+        
+        returns the factor left after summing out X
+        """
+        if self.multiplication == 'fused':
+            return Rs.multiplyAndMarginalize(X)
+        
+        return self.multiply(Rs).marginalize(X)
+    
+    
+    def getMessageKey(self, Rs: FactorGroup, X: str, observed: dict)->tuple:
+        """
+        Returns the key under which the result of multiplying Rs and
+        marginalizing on X is cached. The result only depends on which
+        of the network's factors were multiplied into Rs, on which
+        variables are left, and on the evidence for the variables of
+        those network factors.
+        
+        param Rs: factors about to be multiplied
+        param X: variable about to be eliminated
+        param observed: A dictionary of the observed variables {variable: value}
+        """
+        sources = frozenset().union(*[f.sources for f in Rs.factors])
+        scope = frozenset(Rs.getAllVarNames()) - {X}
+        
+        families = set(sources)
+        for var in sources:
+            families.update(self.network.parents[var])
+            
+        evidence = frozenset((k, v) for k, v in observed.items() if k in families)
+        
+        return sources, scope, evidence
+    
+    
+    def run(self, query: str, observed: dict, elim_heuristic, verbose:bool = True, 
+            cost_tracker:CostTracker = None, log_level:int = None, log_sink = None)->pd.DataFrame:
         """
         Use the variable elimination algorithm to find out the probability
         distribution of the query variable given the observed variables
         
-        Produces a log file and saves it to the working directory.
+        Optionally reports each step to a log.
 
         Input:
             query:      The query variable
@@ -39,111 +298,425 @@ class VariableElimination():
                         variables not including the query and observed variables.
             verbose:    if True, prints updates during computation
             cost_tracker: a CostTracker object to track time.
-            write_report: if True, writes report to file named 'log<epoch_time>'
-                        to the working directory.
+            log_level:  lowest level (from the logging module) to log; steps are
+                        logged at logging.INFO and factors at logging.DEBUG.
+                        By default nothing is logged or formatted.
+            log_sink:   where to log to: an open file, a logging.Logger, or a 
+                        path to write a report file to. If log_level is given
+                        without a sink, the report is written to the file 
+                        'log<epoch time>.txt' in the working directory.
 
         Output: A variable holding the probability distribution
-                for the query variable and a log file outputted to the
-                current working directory.
+                for the query variable.
 
-        (Added verbose, cost_tracker, and write_report to the param list of this function)
+        (Added verbose, cost_tracker, log_level and log_sink to the param list of this function)
         """
-        writer = LogWriter()
+        if self.result_cache is not None:
+            result_key = self.result_cache.key(self.network, query, observed, elim_heuristic)
+            distribution = self.result_cache.get(result_key)
+            
+            if distribution is not None:
+                return distribution
         
-        variables = set(self.network.nodes)
-        writer.print_message("Beginning variable elimination on a network with the following variables: {}".format(variables))  
+        # the 'pandas' backend's factors hold codes, logged as values
+        labels = self.network.values if self.backend == 'pandas' else None
+        if log_level is not None and log_sink is None:
+            log_sink = "log{}.txt".format(time.time())
         
-        writer.print_message("Querying on: {}".format(query))
-        writer.print_message("Evidence: {}".format(observed))
+        # closes a log file the writer opened even if the run fails
+        with LogWriter(log_level, log_sink, labels=labels) as writer:
         
-        factors = self.getInitialFactors(variables, observed)
+            # in network order, so runs (and plans) break heuristic ties alike
+            variables = self.network.nodes
+            writer.print_message("Beginning variable elimination on a network with the following variables: {}", variables)  
         
-        writer.print_message("Reduced factors based on provided evidence. {} variables reduced".format(len(observed)))
+            writer.print_message("Querying on: {}", query)
+            writer.print_message("Evidence: {}", observed)
         
-        writer.print_message("Initial Factors:")
-        writer.print_factorGroup(factors)
+            if self.prune:
+                variables = self.network.relevant_nodes(query, observed)
+                writer.print_message("Pruned to variables relevant to the query: {}", variables)
         
-        elim_order = elim_heuristic(factors, observed.keys(), query)
-        writer.print_message("Elimination ordering heuristic: {}".format(elim_heuristic))
-        writer.print_message("Following elimination ordering: {}".format(elim_order))
+            factors = self.getInitialFactors(variables, observed)
+        
+            writer.print_message("Reduced factors based on provided evidence. {} variables reduced", len(observed))
+        
+            writer.print_message("Initial Factors:")
+            writer.print_factorGroup(factors)
+        
+            if self.max_rows is None:
+                elim_order = elim_heuristic(factors, observed.keys(), query)
+            else:
+                # fail (or reorder) before allocating anything
+                elim_order = self.getBudgetedOrdering(query, observed, elim_heuristic)
+            
+            writer.print_message("Elimination ordering heuristic: {}", elim_heuristic)
+            writer.print_message("Following elimination ordering: {}", elim_order)
     
-        writer.print_message("-"*40)
+            writer.end_message("-")
 
-        for X in elim_order:
+            for X in elim_order:
             
-            writer.print_message("Eliminating: {}".format(X))
+                writer.print_message("Eliminating: {}", X)
             
-            if verbose:
-                print("Eliminating: ", X)
+                if verbose:
+                    print("Eliminating: ", X)
                 
-            Rs = factors.extractInvolving(X)
-            T = Rs.multiply()
+                Rs = factors.extractInvolving(X)
             
-            writer.print_message("Multiplying following factors which contain X:")
-            writer.print_factorGroup(Rs)
+                key = None if self.message_cache is None else self.getMessageKey(Rs, X, observed)
+                cached = None if key is None else self.message_cache.get(key)
             
-            writer.print_message("Multiplication produced:")
-            writer.print_factor(T)
+                if cached is not None:
+                    N = copy(cached)
+                
+                    writer.print_message("Reusing earlier result of multiplying the following factors and marginalizing on {}:", X)
+                    writer.print_factorGroup(Rs)
+                    writer.print_factor(N)
+                
+                else:
+                    writer.print_message("Multiplying following factors which contain X:")
+                    writer.print_factorGroup(Rs)
+                
+                    if self.multiplication == 'fused':
+                        # marginalize changes T in place, so the computations 
+                        # tracked below are counted on the result either way
+                        T = N = Rs.multiplyAndMarginalize(X)
+                    
+                        writer.print_message("Summing out {} while multiplying", X)
+                    else:
+                        T = self.multiply(Rs)
+                    
+                        writer.print_message("Multiplication produced:")
+                        writer.print_factor(T)
+                    
+                        N = T.marginalize(X)
+                    
+                        writer.print_message("Marginalizing above factor on {}", X)
+                    
+                    writer.print_factor(N)
+                
+                    if key is not None:
+                        self.message_cache.put(key, copy(N))
+                
+                    if cost_tracker:
+                        cost_tracker.trackMerges(T, Rs)
+                        cost_tracker.trackSums(N)
+                        writer.print_message("Current total computations: {}", cost_tracker.computations)
+                        
+                if N.scope:
+                    # naming convention only important while determining
+                    # elimination ordering. Thereafter, names only need be unique
+                    N.name = X
+                    factors.append(N)
+                    writer.print_message("Adding marginalized factor to factor list, removing multiplied factors.")
+                else:
+                    writer.print_message("Removing multiplied factors.")
             
-            N = T.marginalize(X)
+                writer.print_message("Remaining factors:")
+                writer.print_factorGroup(factors)
+                writer.end_message("-")
+        
+            writer.print_message("Multiplying remaining factors")
+                             
+            T = self.multiply(factors)
+            normalized_distribution = T.normalize()
+        
+            if cost_tracker:
+                cost_tracker.trackMerges(T, factors)
+                cost_tracker.trackSums(normalized_distribution)
+        
+            distribution = self.decode(normalized_distribution)
+        
+            writer.print_message("Normalizing distribution of query variable.")
+            writer.print_message("Inferred distribution for {} based on {}:", query, observed)
+            writer.print_message("{}", distribution)
+        
+            if cost_tracker:
+                writer.print_message("Approximate total computations: {}", cost_tracker.computations)
             
-            writer.print_message("Marginalizing above factor on {}".format(X))
-            writer.print_factor(N)
-                        
-            if not N.cp_table.empty:
-                # naming convention only important while determining
-                # elimination ordering. Thereafter, names only need be unique
+            writer.print_elapsed_time()
+        
+        if self.result_cache is not None:
+            self.result_cache.put(result_key, distribution)
+        
+        return distribution
+
+
+    def run_parallel(self, query: str, observed: dict, elim_heuristic,
+                     max_workers:int = None, cost_tracker:CostTracker = None)->pd.DataFrame:
+        """
+        Finds the probability distribution of the query variable given the
+        observed variables like run, but runs elimination steps which do not
+        depend on each other's results concurrently on a pool of threads.
+        A step only waits for the steps producing the factors it multiplies,
+        so disconnected components of the reduced factors and independent
+        branches of the elimination tree are eliminated side by side, and
+        combined by the final multiplication. NumPy releases the GIL while
+        multiplying and summing arrays, so this pays off most with the
+        'dense' backend. Does not write a log.
+
+        Input:
+            query:      The query variable
+            observed:   A dictionary of the observed variables {'variable': value}
+            elim_heuristic: A heuristic function as accepted by run.
+            max_workers: number of threads; as ThreadPoolExecutor by default.
+            cost_tracker: a CostTracker object to track computations.
+
+        Output: the distribution of the query variable, as run returns it.
+        """
+        variables = self.network.relevant_nodes(query, observed) if self.prune else self.network.nodes
+        factors = self.getInitialFactors(variables, observed)
+
+        if self.max_rows is None:
+            elim_order = elim_heuristic(factors, observed.keys(), query)
+        else:
+            elim_order = self.getBudgetedOrdering(query, observed, elim_heuristic)
+
+        steps, final = elimination_schedule(factors, elim_order)
+
+        slots = list(factors.factors) + [None] * sum(output is not None for _, _, output in steps)
+
+        # steps consuming each slot, and number of inputs each step
+        # still waits for
+        consumer = {}
+        waiting = []
+        for i, (_, inputs, _) in enumerate(steps):
+            for slot in inputs:
+                consumer[slot] = i
+            waiting.append(sum(slots[slot] is None for slot in inputs))
+
+        def eliminate(X: str, inputs: list)->tuple:
+            Rs = type(factors)(factors.values, max_rows=self.max_rows)
+            Rs.factors = [slots[slot] for slot in inputs]
+            return Rs, self.eliminate(Rs, X)
+
+        with ThreadPoolExecutor(max_workers) as pool:
+
+            running = {}
+
+            def submit(i: int)->None:
+                X, inputs, _ = steps[i]
+                running[pool.submit(eliminate, X, inputs)] = i
+
+            for i in range(len(steps)):
+                if not waiting[i]:
+                    submit(i)
+
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+
+                for future in done:
+                    i = running.pop(future)
+                    X, inputs, output = steps[i]
+                    Rs, N = future.result()
+
+                    # multiplied factors are not needed anymore
+                    for slot in inputs:
+                        slots[slot] = None
+
+                    if cost_tracker:
+                        # counted on the marginalized product, as in run
+                        cost_tracker.trackMerges(N, Rs)
+                        cost_tracker.trackSums(N)
+
+                    if output is not None:
+                        N.name = X
+                        slots[output] = N
+
+                        if output in consumer:
+                            j = consumer[output]
+                            waiting[j] -= 1
+                            if not waiting[j]:
+                                submit(j)
+
+        factors.factors = [slots[slot] for slot in final]
+
+        T = self.multiply(factors)
+        normalized_distribution = T.normalize()
+
+        if cost_tracker:
+            cost_tracker.trackMerges(T, factors)
+            cost_tracker.trackSums(normalized_distribution)
+
+        return self.decode(normalized_distribution)
+
+
+    def run_batch(self, query: str, evidence: pd.DataFrame, elim_heuristic, 
+                  cost_tracker:CostTracker = None)->pd.DataFrame:
+        """
+        Finds the probability distribution of the query variable for many
+        evidence rows over the same observed variables in one elimination.
+        The batch is carried through multiplication and marginalization as
+        an extra axis of the dense factors, which is never eliminated.
+        Does not write a log.
+        
+        Input:
+            query:      The query variable
+            evidence:   A DataFrame with one column per observed variable and
+                        one row per case, holding observed values.
+            elim_heuristic: A heuristic function as accepted by run. It is
+                        evaluated once, on the factors' scopes.
+            cost_tracker: a CostTracker object to track computations.
+            
+        Output: A DataFrame with the index of evidence and one column per
+                value of the query variable, holding the distribution of the
+                query variable given each row. Rows whose evidence has zero
+                probability hold NaN.
+        """
+        batch_var = '__batch__'
+        observed = dict.fromkeys(evidence.columns)
+        values = dict(self.network.values)
+        values[batch_var] = list(evidence.index)
+        
+        observed_codes = {}
+        for var in evidence.columns:
+            codes = pd.Categorical(evidence[var], categories=values[var]).codes
+            if (codes < 0).any():
+                raise ValueError("Evidence for {} holds values ".format(var) +
+                                 "not among {}".format(values[var]))
+            observed_codes[var] = codes
+        
+        variables = self.network.relevant_nodes(query, observed) if self.prune else self.network.nodes
+        
+        # the ordering depends on the scopes alone, which all rows share
+        if self.max_rows is None:
+            elim_order = elim_heuristic(get_initial_scopes(self.network, variables, observed),
+                                        observed.keys(), query)
+        else:
+            # factors carry up to one row per case along the batch axis
+            elim_order = self.getBudgetedOrdering(query, observed, elim_heuristic, 
+                                                  batch_size=len(evidence))
+        
+        factors = DenseFactorGroup(values, max_rows=self.max_rows)
+        for var in variables:
+            new_factor = self.dense_cpts[var].reduceBatch(observed_codes, batch_var)
+            # factors over observed variables alone only scale each row
+            if new_factor.scope != (batch_var,):
+                factors.append(new_factor)
+        
+        for X in elim_order:
+            
+            Rs = factors.extractInvolving(X)
+            N = self.eliminate(Rs, X)
+            
+            if N.scope:
                 N.name = X
                 factors.append(N)
-                writer.print_message("Adding marginalized factor to factor list, removing multiplied factors.")
-            else:
-                writer.print_message("Removing multiplied factors.")
                 
             if cost_tracker:
-                cost_tracker.trackMerges(T, Rs)
+                # counted on the marginalized product, as in run
+                cost_tracker.trackMerges(N, Rs)
                 cost_tracker.trackSums(N)
-                writer.print_message("Current total computations: {}".format(cost_tracker.computations))
-            
-            writer.print_message("Remaining factors:")
-            writer.print_factorGroup(factors)
-            writer.print_message("-"*40)
-        
-        writer.print_message("Multiplying remaining factors")
-                             
-        T = factors.multiply()
-        normalized_distribution = T.normalize()
+                
+        T = self.multiply(factors)
         
         if cost_tracker:
             cost_tracker.trackMerges(T, factors)
-            cost_tracker.trackSums(normalized_distribution)
+            cost_tracker.trackSums(T)
         
-        writer.print_message("Normalizing distribution of query variable.")
-        writer.print_message("Inferred distribution for {} based on {}:".format(query, observed))
-        writer.print_factor(normalized_distribution)
-        writer.print_message("Approximate total computations: {}".format(cost_tracker.computations))
-        writer.print_elapsed_time()
-        writer.write()
+        table = np.broadcast_to(T.expand([batch_var, query]), 
+                                (len(evidence), len(values[query])))
         
-        return normalized_distribution.cp_table
+        with np.errstate(invalid='ignore', divide='ignore'):
+            table = table / table.sum(axis=1, keepdims=True)
+            
+        return pd.DataFrame(table, index=evidence.index, columns=values[query])
+    
+    
+    def run_all(self, observed: dict, elim_heuristic, variables: list = None)->dict:
+        """
+        Finds the probability distribution of every variable given the
+        observed variables at once. Builds a clique tree from an elimination
+        ordering of all variables and calibrates it with two passes of
+        message passing, rather than running variable elimination once per
+        variable.
+        
+        Input:
+            observed:   A dictionary of the observed variables {'variable': value}
+            elim_heuristic: A heuristic function as accepted by run. It is
+                        passed None as the query, and its ordering is used
+                        to build the clique tree.
+            variables:  variables to find distributions for; by default all
+                        variables of the network.
+                        
+        Output: A dictionary {'variable': distribution}, each distribution in
+                the format run returns. Observed variables have all probability
+                on their observed value.
+        """
+        if variables is None:
+            variables = self.network.nodes
+            
+        hidden = [var for var in variables if var not in observed]
         
+        if self.prune:
+            relevant = set()
+            for var in hidden:
+                relevant.update(self.network.relevant_nodes(var, observed))
+            nodes = [var for var in self.network.nodes if var in relevant]
+        else:
+            nodes = self.network.nodes
+            
+        factors = self.getInitialFactors(nodes, observed, backend='dense')
+        tree = CliqueTree(factors, elim_heuristic(factors, observed.keys(), None))
+        tree.calibrate()
         
-    def getInitialFactors(self, variables: set, observed: dict)->FactorGroup:
+        distributions = {}
+        for var in variables:
+            
+            if var in observed:
+                distribution = pd.DataFrame({var: self.network.values[var]})
+                distribution['prob'] = (distribution[var] == observed[var]).astype(float)
+            else:
+                distribution = tree.marginal(var).cp_table
+                
+            distributions[var] = distribution
+            
+        return distributions
+        
+        
+    def session(self, elim_heuristic, observed: dict = None)->InferenceSession:
+        """
+        Starts an InferenceSession on the network, which keeps its
+        messages between queries and evidence changes, so that only the
+        messages an added, changed or retracted observation affects are
+        computed again.
+
+        Input:
+            elim_heuristic: A heuristic function as accepted by run_all.
+            observed:   initial evidence {'variable': value}, if any
+
+        Output: an InferenceSession
+        """
+        return InferenceSession(self.network, elim_heuristic, observed, self.dense_cpts)
+
+
+    def getInitialFactors(self, variables: list, observed: dict, backend: str = None)->FactorGroup:
         """
         Generates and returns the initial dictionary of factors for a
         Bayesian network.
         
-        param variables: set of all variables in the network
+        param variables: all variables in the network
         param observed: A dictionary of the observed variables {variable: value}
+        param backend: 'pandas' or 'dense'; self.backend by default
         
         returns dictionary of reduced factors {'variable': pd.DataFrame (factor)}
         """
-        factors = FactorGroup(self.network.values)
+        backend = backend or self.backend
+        
+        if backend == 'dense':
+            factors = DenseFactorGroup(self.network.values, max_rows=self.max_rows)
+        else:
+            factors = FactorGroup(self.coded_values, max_rows=self.max_rows)
         
         for var in variables:
             
-            new_factor = Factor(var, self.populateFactor(var, observed))
+            if backend == 'dense':
+                new_factor = self.dense_cpts[var].reduce(observed)
+            else:
+                new_factor = Factor(var, self.populateFactor(var, observed), self.coded_values)
 
-            if len(new_factor.cp_table.columns) > 1:
+            if new_factor.scope:
                 # ignores factors which are already fully reduced.
                 # note that the key name is somewhat arbitrary,
                 # it only matter that it be unique
@@ -160,15 +733,41 @@ class VariableElimination():
         param observed: A dictionary of the observed variables {'variable': value}
         
         returns reduced probability table such that rows contradicting
-            observations have been removed (pandas.DataFrame)
+            observations have been removed (pandas.DataFrame), holding
+            the codes of values
         """
-        df = self.network.probabilities[var]
-
-        for key, val in observed.items():
-            # accomodates for non-binary variables
-            if key in df:
-                # reduction; ignores irrelevant rows, drops observed columns
-                # df = df[df["Burglary"] == 'True'].drop(columns=['Burglary'])
-                df = df[df[key] == val].drop(columns=[key])
+        df = self.network.coded_probabilities[var]
+        family = [var] + self.network.parents[var]
+        
+        # accomodates for non-binary variables
+        reduced = [key for key in family if key in observed]
+        
+        if not reduced:
+            return df
+        
+        # reduction; ignores irrelevant rows, drops observed columns.
+        # Indexing the row positions on the codes of the observed values
+        # selects the rows agreeing with all of them at once
+        index = tuple(self.network.encode(key, observed[key]) if key in observed 
+                      else slice(None) for key in family)
+        rows = self.network.row_positions[var][index].ravel()
+        rows = np.sort(rows[rows >= 0])
 
-        return df
+        return df.take(rows).drop(columns=reduced)
+        
+        
+    def decode(self, factor: Factor)->pd.DataFrame:
+        """
+        Returns the conditional probability table of a factor produced
+        by either backend, with values in place of the codes the 'pandas'
+        backend uses.
+        
+        param factor: a factor over variables of the network
+        """
+        cp_table = factor.cp_table
+        
+        if not isinstance(factor, DenseFactor):
+            for var in factor.scope:
+                cp_table[var] = self.network.decode(var, cp_table[var])
+                
+        return cp_table